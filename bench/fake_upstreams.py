@@ -0,0 +1,248 @@
+# bench/fake_upstreams.py
+#
+# Local stand-in for the Places, Geocoding and Gemini APIs. Responses are built
+# from the recorded payloads in bench/payloads, and each upstream gets its own
+# latency distribution and error rate so benchmarks are reproducible.
+#
+#   python -m bench.fake_upstreams --port 9100 --places-latency 120,400 --error-rate 0.01
+#
+# Point the app at it with MAPS_BASE_URL=http://127.0.0.1:9100 and
+# GEMINI_BASE_URL=http://127.0.0.1:9100
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(__file__), "payloads")
+
+def load_payload(name):
+    with open(os.path.join(PAYLOAD_DIR, f"{name}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+PLACES = load_payload("places")
+DETAILS = load_payload("details")
+GEOCODE = load_payload("geocode")
+GEMINI = load_payload("gemini")
+
+# Latency is lognormal, given as (median ms, p95 ms) per upstream
+CONFIG = {
+    "latency": {
+        "textsearch": (150.0, 450.0),
+        "nearbysearch": (120.0, 350.0),
+        "details": (80.0, 250.0),
+        "geocode": (60.0, 180.0),
+        "gemini": (1200.0, 3500.0),
+    },
+    "error_rate": {name: 0.0 for name in ("textsearch", "nearbysearch", "details", "geocode", "gemini")},
+    # Delay between streamed Gemini chunks
+    "chunk_ms": 40.0,
+    "seed": None,
+}
+
+_rng = random.Random()
+counts = {name: 0 for name in CONFIG["latency"]}
+
+app = FastAPI(title="Fake upstreams")
+
+async def simulate(upstream):
+    """Sleep for a sampled latency; returns True if this call should fail"""
+    counts[upstream] += 1
+    median, p95 = CONFIG["latency"][upstream]
+    if median > 0:
+        sigma = math.log(max(p95, median) / median) / 1.645
+        await asyncio.sleep(_rng.lognormvariate(math.log(median), sigma) / 1000)
+    return _rng.random() < CONFIG["error_rate"][upstream]
+
+def stable_int(*parts):
+    return int(hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:8], 16)
+
+def place_id(lat, lng, index, salt):
+    # Ids carry their coordinates so the details endpoint stays stateless
+    return f"bench:{lat:.6f}:{lng:.6f}:{index}:{salt}"
+
+def search_results(lat, lon, radius, query):
+    """Deterministic results for an area, so repeated searches hit the same places"""
+    # Results are anchored to a ~1km grid so nearby callers see overlapping places
+    anchor_lat, anchor_lon = round(lat, 2), round(lon, 2)
+    seed = stable_int(anchor_lat, anchor_lon, query, radius)
+    rng = random.Random(seed)
+    spread = radius / 111000.0
+
+    results = []
+    for i in range(PLACES["results_per_page"]):
+        area = rng.choice(PLACES["areas"])
+        name = rng.choice(PLACES["names"]).format(area=area, query=query.title())
+        p_lat = anchor_lat + rng.uniform(-spread, spread) * 0.7
+        p_lng = anchor_lon + rng.uniform(-spread, spread) * 0.7
+        results.append({
+            "place_id": place_id(p_lat, p_lng, i, seed % 10000),
+            "name": name,
+            "formatted_address": f"{rng.randint(10, 2999)} {rng.choice(PLACES['streets'])}, {area}",
+            "vicinity": f"{rng.randint(10, 2999)} {rng.choice(PLACES['streets'])}",
+            "geometry": {"location": {"lat": p_lat, "lng": p_lng}},
+            "types": rng.choice(PLACES["types"]),
+            "business_status": PLACES["business_status"],
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "user_ratings_total": rng.randint(3, 900),
+        })
+    return {"html_attributions": [], "results": results, "status": "OK"}
+
+def maps_error():
+    return JSONResponse({"results": [], "status": "UNKNOWN_ERROR"})
+
+def parse_location(value):
+    lat, lon = value.split(",")
+    return float(lat), float(lon)
+
+@app.get("/maps/api/place/textsearch/json")
+async def textsearch(query: str, location: str, radius: int = 5000):
+    if await simulate("textsearch"):
+        return maps_error()
+    return search_results(*parse_location(location), radius, query)
+
+@app.get("/maps/api/place/nearbysearch/json")
+async def nearbysearch(location: str, type: str = "", radius: int = 5000):
+    if await simulate("nearbysearch"):
+        return maps_error()
+    return search_results(*parse_location(location), radius, type.replace("_", " "))
+
+@app.get("/maps/api/place/details/json")
+async def details(place_id: str, fields: str = ""):
+    if await simulate("details"):
+        return maps_error()
+    try:
+        _, lat, lng, _, _ = place_id.split(":")
+    except ValueError:
+        return JSONResponse({"status": "INVALID_REQUEST"})
+
+    result = dict(DETAILS["result"])
+    result["geometry"] = {"location": {"lat": float(lat), "lng": float(lng)}}
+    # Vary ratings per place so ranking and caching see distinct records
+    rng = random.Random(place_id)
+    result["rating"] = round(rng.uniform(3.0, 5.0), 1)
+    result["user_ratings_total"] = rng.randint(3, 900)
+
+    # Only return what was asked for, like the real API
+    requested = set(fields.split(",")) if fields else set(result)
+    return {
+        "html_attributions": [],
+        "result": {k: v for k, v in result.items() if k in requested},
+        "status": "OK",
+    }
+
+@app.get("/maps/api/geocode/json")
+async def geocode(latlng: str = None, address: str = None):
+    if await simulate("geocode"):
+        return maps_error()
+    data = json.loads(json.dumps(GEOCODE))
+    data.pop("_comment", None)
+    if latlng:
+        lat, lng = parse_location(latlng)
+        data["results"][0]["geometry"]["location"] = {"lat": lat, "lng": lng}
+    return data
+
+def gemini_chunk(text, finish=False):
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": GEMINI["prompt_tokens"],
+            "candidatesTokenCount": len(GEMINI["reply"]) // 4,
+        },
+        "modelVersion": "bench",
+    }
+
+@app.post("/{version}/models/{model_action}")
+async def gemini(version: str, model_action: str, request: Request):
+    _, _, action = model_action.partition(":")
+    await request.body()
+    if await simulate("gemini"):
+        return JSONResponse(
+            {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}},
+            status_code=503
+        )
+
+    if action != "streamGenerateContent":
+        return gemini_chunk(GEMINI["reply"], finish=True)
+
+    words = GEMINI["reply"].split(" ")
+    size = GEMINI["chunk_words"]
+    chunks = [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+    async def stream():
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(CONFIG["chunk_ms"] / 1000)
+            yield f"data: {json.dumps(gemini_chunk(chunk, finish=i == len(chunks) - 1))}\r\n\r\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/_stats")
+async def stats():
+    return {"calls": counts, "config": CONFIG}
+
+def parse_latency(value):
+    median, _, p95 = value.partition(",")
+    return float(median), float(p95 or median)
+
+def add_arguments(parser):
+    for name in CONFIG["latency"]:
+        median, p95 = CONFIG["latency"][name]
+        parser.add_argument(f"--{name}-latency", type=parse_latency, metavar="MEDIAN,P95",
+                            help=f"{name} latency in ms (default {median:g},{p95:g})")
+    parser.add_argument("--places-latency", type=parse_latency, metavar="MEDIAN,P95",
+                        help="shorthand for textsearch, nearbysearch and details latency")
+    parser.add_argument("--error-rate", type=float, help="failure probability for every upstream")
+    for name in CONFIG["error_rate"]:
+        parser.add_argument(f"--{name}-error-rate", type=float, help=f"failure probability for {name}")
+    parser.add_argument("--chunk-ms", type=float, help="delay between streamed Gemini chunks")
+    parser.add_argument("--upstream-seed", type=int, help="seed for latency and error sampling")
+
+# Option names accepted by add_arguments, for callers that forward them to a subprocess
+CONFIG_ARGUMENTS = (
+    {f"{name}_latency" for name in CONFIG["latency"]}
+    | {f"{name}_error_rate" for name in CONFIG["error_rate"]}
+    | {"places_latency", "error_rate", "chunk_ms", "upstream_seed"}
+)
+
+def apply_arguments(args):
+    if args.places_latency:
+        for name in ("textsearch", "nearbysearch", "details"):
+            CONFIG["latency"][name] = args.places_latency
+    if args.error_rate is not None:
+        for name in CONFIG["error_rate"]:
+            CONFIG["error_rate"][name] = args.error_rate
+    for name in CONFIG["latency"]:
+        latency = getattr(args, f"{name}_latency")
+        if latency:
+            CONFIG["latency"][name] = latency
+        error_rate = getattr(args, f"{name}_error_rate")
+        if error_rate is not None:
+            CONFIG["error_rate"][name] = error_rate
+    if args.chunk_ms is not None:
+        CONFIG["chunk_ms"] = args.chunk_ms
+    if args.upstream_seed is not None:
+        CONFIG["seed"] = args.upstream_seed
+        _rng.seed(args.upstream_seed)
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Places, Geocoding and Gemini upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    apply_arguments(args)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
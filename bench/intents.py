@@ -0,0 +1,47 @@
+# bench/intents.py
+#
+# Expected categories for a table of chat messages, checked against the intent
+# ranker. Run it after touching the keyword lists or the matcher; it exits
+# non-zero and prints the differences if any message is ranked differently.
+#
+#   python -m bench.intents
+
+import sys
+from services.intent import rank_service_types
+
+# Message -> categories rank_service_types should return, main need first
+CASES = [
+    # Inflected forms still reach their category
+    ("feeling stressed", ["MENTAL_HEALTH"]),
+    ("I'm so stressed out", ["MENTAL_HEALTH"]),
+    ("I'm traumatized", ["MENTAL_HEALTH"]),
+    ("I need rehabilitation", ["MENTAL_HEALTH"]),
+    ("urgently need help", ["EMERGENCY"]),
+    ("need healthcare", ["MEDICAL"]),
+    ("I was hospitalized", ["MEDICAL"]),
+    ("need transportation", ["TRANSPORTATION"]),
+    ("I'm homelessness", ["SHELTER"]),
+    ("I have a chronic illness", ["MEDICAL"]),
+    # Keywords inside other words do not add categories
+    ("my partner is threatening me, I need a shelter", ["SHELTER", "EMERGENCY"]),
+    ("things changed and I will manage", []),
+    ("that is great", []),
+    # Compound requests
+    ("my kid is sick and we have nowhere to sleep", ["SHELTER", "MEDICAL"]),
+    ("I haven't eaten in two days, where can I get free food?", ["FOOD"]),
+    ("I need free legal help with my eviction", ["LEGAL"]),
+    ("Where can I study for my GED?", ["EDUCATION"]),
+]
+
+def main():
+    failures = 0
+    for message, expected in CASES:
+        got = [category for category, _ in rank_service_types(message)]
+        if got != expected:
+            failures += 1
+            print(f"FAIL {message!r}: expected {expected}, got {got}")
+    print(f"{len(CASES) - failures}/{len(CASES)} messages ranked as expected")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# bench/loadgen.py
+#
+# Closed-loop load generator for /api/chat and /api/discover. Each concurrency
+# level keeps that many requests in flight and reports throughput and latency
+# percentiles, plus the mean time per stage taken from the app's /metrics.
+#
+#   python -m bench.loadgen --url http://127.0.0.1:8100 --endpoint chat --concurrency 1,8,32
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import httpx
+
+# One message per category, so intent classification spreads load like real traffic
+MESSAGES = {
+    "FOOD": "I haven't eaten in two days, where can I get free food?",
+    "SHELTER": "I need a place to stay tonight, I'm homeless",
+    "MEDICAL": "I need to see a doctor but I don't have insurance",
+    "MENTAL_HEALTH": "I've been feeling really anxious and depressed lately",
+    "LEGAL": "I need free legal help with my eviction",
+    "EDUCATION": "Where can I study for my GED?",
+    "FINANCIAL": "I can't pay my electric bill this month",
+    "TRANSPORTATION": "How do I get to the bus station from here?",
+    "EMERGENCY": "There's an emergency, where is the nearest hospital?",
+    "COMMUNITY_NGOS": "Are there community centers with programs for kids?",
+}
+AGE_GROUPS = ["10-12", "13-17", "18+"]
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+def random_point(rng, center, spread_km):
+    lat, lon = center
+    d_lat = rng.uniform(-spread_km, spread_km) / 111.0
+    d_lon = rng.uniform(-spread_km, spread_km) / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+    return lat + d_lat, lon + d_lon
+
+def build_request(endpoint, rng, args):
+    lat, lon = random_point(rng, args.center, args.spread_km)
+    category = rng.choice(args.categories)
+    if endpoint == "discover":
+        return "/api/discover", {"category": category, "latitude": lat, "longitude": lon}
+    return "/api/chat", {
+        "messages": [{"role": "user", "content": MESSAGES[category]}],
+        "latitude": lat,
+        "longitude": lon,
+        "age_group": rng.choice(AGE_GROUPS),
+    }
+
+def parse_stage_totals(text):
+    """(sum, count) per stage from the app's Prometheus stage histogram"""
+    totals = {}
+    prefix = "connectcare_stage_duration_seconds_"
+    for line in text.splitlines():
+        if not line.startswith(prefix) or "_bucket" in line:
+            continue
+        series, value = line.rsplit(" ", 1)
+        kind = series[len(prefix):].split("{", 1)[0]
+        stage = series.split('stage="', 1)[1].split('"', 1)[0]
+        entry = totals.setdefault(stage, [0.0, 0])
+        if kind == "sum":
+            entry[0] = float(value)
+        elif kind == "count":
+            entry[1] = int(float(value))
+    return totals
+
+async def stage_totals(client):
+    try:
+        response = await client.get("/metrics")
+        return parse_stage_totals(response.text)
+    except httpx.HTTPError:
+        return {}
+
+async def run_level(client, endpoint, concurrency, args, rng, requests, duration=None):
+    latencies = []
+    errors = 0
+    issued = 0
+    deadline = time.monotonic() + duration if duration else None
+
+    def more():
+        if deadline is not None:
+            return time.monotonic() < deadline
+        return issued < requests
+
+    async def worker():
+        nonlocal errors, issued
+        while more():
+            issued += 1
+            path, body = build_request(endpoint, rng, args)
+            start = time.monotonic()
+            try:
+                response = await client.post(path, json=body)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.monotonic() - start
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    before = await stage_totals(client)
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.monotonic() - started
+    after = await stage_totals(client)
+
+    stages = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            stages[stage] = (total - prev_total) / (count - prev_count) * 1000
+
+    ordered = sorted(latencies)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput": (len(latencies) + errors) / wall if wall else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+        "stage_mean_ms": stages,
+    }
+
+def print_result(result):
+    print(
+        f"{result['endpoint']:<9} c={result['concurrency']:<4} n={result['requests']:<6} "
+        f"err={result['errors']:<4} {result['throughput']:8.1f} req/s  "
+        f"p50={result['p50_ms']:7.1f}ms p95={result['p95_ms']:7.1f}ms "
+        f"p99={result['p99_ms']:7.1f}ms max={result['max_ms']:7.1f}ms"
+    )
+    if result["stage_mean_ms"]:
+        stages = ", ".join(f"{stage} {ms:.1f}" for stage, ms in sorted(result["stage_mean_ms"].items()))
+        print(f"{'':<9} stage means (ms): {stages}")
+
+async def run(args):
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency))
+    results = []
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        for endpoint in args.endpoint:
+            if args.warmup:
+                await run_level(client, endpoint, 1, args, rng, args.warmup)
+            for concurrency in args.concurrency:
+                result = await run_level(client, endpoint, concurrency, args, rng, args.requests, args.duration)
+                print_result(result)
+                results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+def parse_center(value):
+    lat, lon = value.split(",")
+    return float(lat), float(lon)
+
+def add_arguments(parser):
+    parser.add_argument("--endpoint", action="append", choices=["chat", "discover"],
+                        help="endpoint to load (repeatable, default: both)")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 8, 32],
+                        help="comma-separated in-flight request levels (default 1,8,32)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    parser.add_argument("--duration", type=float, help="seconds per level (overrides --requests)")
+    parser.add_argument("--warmup", type=int, default=0, help="untimed requests before each endpoint")
+    parser.add_argument("--center", type=parse_center, default=(37.7749, -122.4194), help="lat,lon of the load area")
+    parser.add_argument("--spread-km", type=float, default=5.0,
+                        help="half-width of the load area; smaller means more cache hits")
+    parser.add_argument("--categories", type=lambda v: v.split(","), default=list(MESSAGES),
+                        help="comma-separated categories to draw from (default: all)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write results to this file")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for /api/chat and /api/discover")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL of the running app")
+    add_arguments(parser)
+    args = parser.parse_args()
+    args.endpoint = args.endpoint or ["chat", "discover"]
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# bench/run.py
+#
+# One-shot benchmark: starts the fake upstreams and the app (pointed at them)
+# as subprocesses, runs the load generator, then shuts everything down.
+#
+#   python -m bench.run --endpoint chat --concurrency 1,8,32 --requests 300
+#   python -m bench.run --places-latency 300,1200 --error-rate 0.02 --json before.json
+#
+# Extra app settings can be passed as environment variables, e.g.
+#   RADIUS_MODE=sequential python -m bench.run
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from bench import fake_upstreams, loadgen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def wait_ready(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout:.0f}s")
+
+def upstream_arguments(args):
+    """Re-serialise the fake upstream options for its subprocess"""
+    argv = []
+    for key, value in vars(args).items():
+        if value is None or key not in fake_upstreams.CONFIG_ARGUMENTS:
+            continue
+        if isinstance(value, tuple):
+            value = ",".join(str(v) for v in value)
+        argv += [f"--{key.replace('_', '-')}", str(value)]
+    return argv
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app against local fake upstreams")
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--upstream-port", type=int, default=9100)
+    parser.add_argument("--keep-state", action="store_true",
+                        help="reuse place_index.db/outbox.db in the working directory instead of a fresh temp dir")
+    fake_upstreams.add_arguments(parser)
+    loadgen.add_arguments(parser)
+    args = parser.parse_args()
+    args.endpoint = args.endpoint or ["chat", "discover"]
+
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    state_dir = ROOT if args.keep_state else tempfile.mkdtemp(prefix="bench-")
+
+    env = {
+        **os.environ,
+        "MAPS_BASE_URL": upstream_url,
+        "GEMINI_BASE_URL": upstream_url,
+        "GOOGLE_API_KEY": "bench",
+        "GEMINI_API_KEY": "bench",
+        "PLACE_INDEX_PATH": os.path.join(state_dir, "place_index.db"),
+        "OUTBOX_PATH": os.path.join(state_dir, "outbox.db"),
+        # The fake servers speak plain HTTP/1.1
+        "UPSTREAM_HTTP2": "false",
+    }
+
+    processes = []
+    try:
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "bench.fake_upstreams", "--port", str(args.upstream_port)] + upstream_arguments(args),
+            cwd=ROOT, env=env
+        ))
+        wait_ready(f"{upstream_url}/_stats")
+
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"],
+            cwd=ROOT, env=env
+        ))
+        wait_ready(f"{app_url}/metrics")
+
+        args.url = app_url
+        asyncio.run(loadgen.run(args))
+        print(f"Upstream calls: {httpx.get(f'{upstream_url}/_stats').json()['calls']}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+
+if __name__ == "__main__":
+    main()
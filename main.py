@@ -1,16 +1,50 @@
 # main.py
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from schemas import ChatRequest, ChatResponse, DiscoverRequest, DiscoverResponse, ContactRequest
-from services.intent import classify_service_type
-from services.geocode import reverse_geocode
-from services.places import find_places
-from services.gemini import generate_reply
-from services.email import send_contact_email
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from schemas import (
+    ChatRequest, ChatResponse, ChatMessage, DiscoverRequest, DiscoverResponse, ContactRequest, Place,
+    DiscoverBatchRequest, DiscoverBatchResponse,
+    SessionCreateRequest, SessionCreateResponse, SessionMessageRequest
+)
+from services.intent import rank_service_types
+from services.geocode import reverse_geocode_async
+from services.gazetteer import load_gazetteer
+from services.places import find_places, find_places_batch
+from services.gemini import generate_reply_async, stream_reply
+from services.email import build_contact_params
+from services.outbox import enqueue_email, start_worker, stop_worker, queue_stats
+from services.sessions import (
+    create_session, get_session, save_session, session_lock, move_session, needs_new_places, session_categories
+)
+from services.admission import (
+    ADMISSION_ENABLED, ADMISSION_RETRY_AFTER, ADMISSION_ROUTES, OverloadedError, admission_stats, admit, degraded, finish
+)
+from services.upstream import start_clients, close_clients, pool_stats
+from services.resilience import upstream_budget, circuit_stats
+from services.scheduler import PRIORITY_DISCOVER, chat_priority, scheduler_stats, upstream_priority
+from services.metrics import (
+    METRICS_TIMING_HEADER, cache_hit_ratios, inc, observe, render, server_timing_header, start_timings
+)
+from contextlib import asynccontextmanager
 import asyncio
+import json
+import time
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled upstream clients live for the whole process, not per request
+    await start_clients()
+    # The gazetteer can be large, so load it off the event loop
+    await asyncio.to_thread(load_gazetteer)
+    # Contact emails are delivered from the durable outbox in the background
+    start_worker()
+    yield
+    await stop_worker()
+    await close_clients()
 
-app = FastAPI(title="ConnectCare AI Backend")
+app = FastAPI(title="ConnectCare AI Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,21 +53,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Registered before the metrics middleware so that one wraps it and counts rejections too
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    endpoint = ADMISSION_ROUTES.get(request.url.path)
+    if not ADMISSION_ENABLED or endpoint is None:
+        return await call_next(request)
+
+    # Turn excess load away before it costs anything, rather than slowing everyone down
+    try:
+        ticket = admit(endpoint)
+    except OverloadedError:
+        return JSONResponse(
+            {"detail": "Service is busy, please retry shortly"},
+            status_code=503,
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+        )
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        finish(ticket)
+        raise
+    if ticket["degraded"]:
+        response.headers["X-Degraded"] = "true"
+
+    # The request stays in flight until its body (e.g. a whole SSE stream) has been sent
+    body = response.body_iterator
+
+    async def finish_after_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            finish(ticket)
+
+    response.body_iterator = finish_after_body()
+    return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.monotonic()
+    timings = start_timings()
+    response = await call_next(request)
+    elapsed = time.monotonic() - start
+
+    # Label by route template so ids in paths don't explode the series count
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    observe("http_request_duration_seconds", elapsed, route=path)
+    inc("http_requests_total", route=path, status=str(response.status_code))
+
+    # Streaming responses only report the stages finished before the body started
+    if METRICS_TIMING_HEADER:
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+def message_categories(message, default="FOOD"):
+    """Top matched categories for a message, main need first; compound needs are looked up together"""
+    return [category for category, _ in rank_service_types(message)] or [default]
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(payload: ChatRequest):
     try:
         latest_message = payload.messages[-1].content
-        service_type = classify_service_type(latest_message)
+        categories = message_categories(latest_message)
+        service_type = categories[0]
 
-        location_info = reverse_geocode(payload.latitude, payload.longitude)
-        places = await find_places(payload.latitude, payload.longitude, service_type)
+        # Geocoding and the places lookup are independent, so run them side by side
+        with upstream_budget(), upstream_priority(chat_priority(categories)):
+            location_info, found = await asyncio.gather(
+                reverse_geocode_async(payload.latitude, payload.longitude),
+                find_places_batch(payload.latitude, payload.longitude, categories)
+            )
 
-        reply = generate_reply(
+        reply = await generate_reply_async(
             messages=payload.messages,
             location_info=location_info,
-            places=places,
+            places=found[service_type],
             age_group=payload.age_group,
-            service_type=service_type
+            service_type=service_type,
+            related={c: found[c] for c in categories[1:]}
         )
 
         return ChatResponse(reply=reply)
@@ -41,24 +141,197 @@ async def chat(payload: ChatRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/session", response_model=SessionCreateResponse)
+async def start_session(payload: SessionCreateRequest):
+    session_id = await asyncio.to_thread(create_session, payload.latitude, payload.longitude, payload.age_group)
+    return SessionCreateResponse(session_id=session_id)
+
+@app.post("/api/session/message", response_model=ChatResponse)
+async def session_message(payload: SessionMessageRequest):
+    """Chat turn against server-held state: only the new message (and any new location) is sent"""
+    # Sessions are shared between workers, so the turn starts from the stored state
+    async with session_lock(payload.session_id):
+        session = await asyncio.to_thread(get_session, payload.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+
+        try:
+            move_session(session, payload.latitude, payload.longitude)
+            session["messages"].append(ChatMessage(role="user", content=payload.message))
+
+            # A follow-up without category keywords stays on the current categories
+            ranked = [category for category, _ in rank_service_types(payload.message)]
+            categories = ranked or session_categories(session) or ["FOOD"]
+            service_type = categories[0]
+            lat, lon = session["latitude"], session["longitude"]
+
+            # Only redo geocoding and the places lookup when something material changed
+            tasks = []
+            if session["location_info"] is None:
+                tasks.append(reverse_geocode_async(lat, lon))
+            if needs_new_places(session, categories):
+                tasks.append(find_places_batch(lat, lon, categories))
+
+            places, related = session["places"], session["related"]
+            if tasks:
+                with upstream_budget(), upstream_priority(chat_priority(categories)):
+                    results = await asyncio.gather(*tasks)
+                if session["location_info"] is None:
+                    session["location_info"] = results.pop(0)
+                if results:
+                    found = results[0]
+                    places = found[service_type]
+                    related = {c: found[c] for c in categories[1:]}
+                    # Cache-only places from a degraded turn aren't kept, so the next turn looks again
+                    if not degraded():
+                        session["places"] = places
+                        session["related"] = related
+                        session["places_at"] = (lat, lon)
+                        session["service_type"] = service_type
+
+            reply = await generate_reply_async(
+                messages=session["messages"],
+                location_info=session["location_info"],
+                places=places,
+                age_group=session["age_group"],
+                service_type=service_type,
+                related=related
+            )
+
+            session["messages"].append(ChatMessage(role="assistant", content=reply))
+            await asyncio.to_thread(save_session, payload.session_id, session)
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return ChatResponse(reply=reply)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(payload: ChatRequest):
+    """Server-Sent Events variant of /api/chat: places first, then reply tokens"""
+    latest_message = payload.messages[-1].content
+    categories = message_categories(latest_message)
+    service_type = categories[0]
+
+    async def events():
+        try:
+            with upstream_budget(), upstream_priority(chat_priority(categories)):
+                location_info, found = await asyncio.gather(
+                    reverse_geocode_async(payload.latitude, payload.longitude),
+                    find_places_batch(payload.latitude, payload.longitude, categories)
+                )
+            related = {c: found[c] for c in categories[1:]}
+
+            # Send the resource list as soon as it is known
+            yield sse_event("places", {
+                "service_type": service_type,
+                "places": [Place(**p).model_dump() for p in found[service_type]],
+                "related": {c: [Place(**p).model_dump() for p in extra] for c, extra in related.items()}
+            })
+
+            async for event, text in stream_reply(
+                messages=payload.messages,
+                location_info=location_info,
+                places=found[service_type],
+                age_group=payload.age_group,
+                service_type=service_type,
+                related=related
+            ):
+                yield sse_event(event, {"text": text})
+
+            yield sse_event("done", {})
+
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/discover", response_model=DiscoverResponse)
 async def discover(payload: DiscoverRequest):
     try:
-        places = await find_places(payload.latitude, payload.longitude, payload.category)
+        with upstream_budget(), upstream_priority(PRIORITY_DISCOVER):
+            places = await find_places(payload.latitude, payload.longitude, payload.category)
         return DiscoverResponse(places=places)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/discover/batch", response_model=DiscoverBatchResponse)
+async def discover_batch(payload: DiscoverBatchRequest):
+    """Several category tiles in one round trip, sharing searches and details across categories"""
+    if not payload.categories:
+        raise HTTPException(status_code=400, detail="categories must not be empty")
+    try:
+        with upstream_budget(), upstream_priority(PRIORITY_DISCOVER):
+            results = await find_places_batch(payload.latitude, payload.longitude, payload.categories)
+        return DiscoverBatchResponse(results=results)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/upstream/stats")
+async def upstream_stats():
+    return {"pools": pool_stats(), "circuits": circuit_stats(), "scheduler": scheduler_stats()}
+
+@app.get("/api/admission/stats")
+async def admission_state():
+    return admission_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    pools = pool_stats()
+    circuits = circuit_stats()
+    scheduler = scheduler_stats()
+    admission = admission_stats()
+    outbox = await asyncio.to_thread(queue_stats)
+    gauges = [
+        ("cache_hit_ratio", "Share of lookups served from each cache since startup",
+         {(("cache", cache),): ratio for cache, ratio in cache_hit_ratios().items()}),
+        ("upstream_connections_open", "Open pooled connections per upstream",
+         {(("upstream", name),): entry["connections_open"] for name, entry in pools.items()}),
+        ("upstream_connections_idle", "Idle pooled connections per upstream",
+         {(("upstream", name),): entry["connections_idle"] for name, entry in pools.items()}),
+        ("upstream_requests_waiting", "Requests queued for a pooled connection per upstream",
+         {(("upstream", name),): entry["requests_waiting"] for name, entry in pools.items()}),
+        ("circuit_open", "1 while an endpoint's circuit breaker is open or half-open",
+         {(("endpoint", name),): int(entry["state"] != "closed") for name, entry in circuits.items()}),
+        ("scheduler_in_flight", "Upstream calls holding a scheduler slot per endpoint",
+         {(("endpoint", name),): entry["in_flight"] for name, entry in scheduler["endpoints"].items()}),
+        ("scheduler_waiting", "Upstream calls queued for a scheduler slot per priority class",
+         {(("priority", name),): count for name, count in scheduler["waiting"].items()}),
+        ("admission_in_flight", "API requests in flight per endpoint under admission control",
+         {(("endpoint", name),): entry["in_flight"] for name, entry in admission.items()}),
+        ("admission_degraded", "1 while new requests to an endpoint are served degraded",
+         {(("endpoint", name),): int(entry["degraded"]) for name, entry in admission.items()}),
+        ("admission_latency_p95_seconds", "Recent p95 latency of fully served requests per endpoint",
+         {(("endpoint", name),): entry["p95"] for name, entry in admission.items() if entry["p95"] is not None}),
+        ("outbox_pending", "Contact emails waiting for delivery", {(): outbox["pending"]}),
+        ("outbox_dead", "Contact emails that exhausted their delivery attempts", {(): outbox["dead"]}),
+        ("outbox_oldest_pending_age_seconds", "Age of the oldest undelivered contact email",
+         {(): outbox["oldest_pending_age"]}),
+    ]
+    return render(gauges)
+
+@app.get("/api/outbox/stats")
+async def outbox_stats():
+    return await asyncio.to_thread(queue_stats)
+
 @app.post("/api/contact")
 async def contact(payload: ContactRequest):
     try:
-        send_contact_email(
+        await enqueue_email(build_contact_params(
             name=payload.name,
             email=payload.email,
             subject=payload.subject,
             message=payload.message
-        )
+        ))
 
-        return {"success": True, "message": "Email sent successfully"}
+        return {"success": True, "message": "Email queued for delivery"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,110 @@
+# prewarm.py
+#
+# Pre-computes places for every category across a region before traffic
+# arrives, so the first users in a neighbourhood are served from the local
+# place index instead of paying the full upstream fan-out.
+#
+#   python prewarm.py --city "Oakland, CA" --city "Berkeley, CA"
+#   python prewarm.py --bbox 37.70,-122.52,37.82,-122.35 --categories FOOD,SHELTER
+
+import argparse
+import asyncio
+import time
+from services.geocell import cells_in_bbox
+from services.geocode import geocode_bounds
+from services.places import CATEGORY_CONFIG, find_places
+from services.place_index import index_enabled
+from services.scheduler import PRIORITY_BACKGROUND, upstream_priority
+from services.upstream import close_clients, pool_stats
+
+def parse_bbox(value):
+    south, west, north, east = (float(v) for v in value.split(","))
+    return south, west, north, east
+
+async def resolve_regions(args):
+    regions = [(bbox, ",".join(str(v) for v in bbox)) for bbox in args.bbox]
+    for city in args.city:
+        bbox = await geocode_bounds(city)
+        if bbox is None:
+            print(f"Could not geocode {city!r}, skipping")
+            continue
+        regions.append((bbox, city))
+    return regions
+
+def upstream_calls():
+    return sum(entry["requests"] for entry in pool_stats().values())
+
+async def prewarm(args):
+    categories = args.categories.split(",") if args.categories else list(CATEGORY_CONFIG)
+    unknown = [c for c in categories if c not in CATEGORY_CONFIG]
+    if unknown:
+        raise SystemExit(f"Unknown categories: {', '.join(unknown)}")
+
+    cells = {}
+    for bbox, label in await resolve_regions(args):
+        region_cells = cells_in_bbox(*bbox)
+        print(f"{label}: {len(region_cells)} cells")
+        cells.update(region_cells)
+
+    jobs = [(category, lat, lon) for (lat, lon) in cells.values() for category in categories]
+    print(f"{len(cells)} cells x {len(categories)} categories = {len(jobs)} lookups")
+    if args.dry_run or not jobs:
+        return
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    calls_before = upstream_calls()
+    started = time.monotonic()
+    done = 0
+    found = 0
+
+    async def run(category, lat, lon):
+        nonlocal done, found
+        async with semaphore:
+            try:
+                places = await find_places(lat, lon, category)
+                found += len(places)
+            except Exception as e:
+                print(f"{category} at {lat:.5f},{lon:.5f} failed: {e}")
+        done += 1
+        if done % args.report_every == 0 or done == len(jobs):
+            elapsed = time.monotonic() - started
+            print(
+                f"[{done}/{len(jobs)}] {elapsed:.0f}s elapsed, "
+                f"{upstream_calls() - calls_before} API calls, {found} places"
+            )
+
+    # Lookups are started at no more than --rate per second on top of the concurrency bound
+    tasks = []
+    for category, lat, lon in jobs:
+        tasks.append(asyncio.create_task(run(category, lat, lon)))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+
+    print(f"Done: {len(jobs)} lookups, {upstream_calls() - calls_before} API calls spent")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the place index for a region")
+    parser.add_argument("--bbox", action="append", type=parse_bbox, default=[],
+                        help="south,west,north,east (repeatable)")
+    parser.add_argument("--city", action="append", default=[],
+                        help="city or address whose viewport to warm (repeatable)")
+    parser.add_argument("--categories", help="comma-separated categories (default: all)")
+    parser.add_argument("--concurrency", type=int, default=4, help="lookups in flight at once")
+    parser.add_argument("--rate", type=float, default=2.0, help="lookups started per second")
+    parser.add_argument("--report-every", type=int, default=25, help="progress line interval")
+    parser.add_argument("--dry-run", action="store_true", help="only report how many lookups would run")
+    args = parser.parse_args()
+
+    if not args.bbox and not args.city:
+        parser.error("give at least one --bbox or --city")
+    if not index_enabled():
+        parser.error("PLACE_INDEX_PATH is empty - warmed results would not be visible to the server")
+
+    try:
+        with upstream_priority(PRIORITY_BACKGROUND):
+            await prewarm(args)
+    finally:
+        await close_clients()
+
+if __name__ == "__main__":
+    asyncio.run(main())
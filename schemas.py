@@ -1,12 +1,12 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, List, Optional
 
 class ChatMessage(BaseModel):
     role: str   # "user" or "assistant"
     content: str
 
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
+    messages: List[ChatMessage] = Field(min_length=1)   # latest message last
     latitude: float
     longitude: float
     age_group: str   # "0-3", "4-9", "10-12", "13-17", "18+"
@@ -14,11 +14,30 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     reply: str
 
+class SessionCreateRequest(BaseModel):
+    latitude: float
+    longitude: float
+    age_group: str   # "0-3", "4-9", "10-12", "13-17", "18+"
+
+class SessionCreateResponse(BaseModel):
+    session_id: str
+
+class SessionMessageRequest(BaseModel):
+    session_id: str
+    message: str
+    latitude: Optional[float] = None    # only when the user has moved
+    longitude: Optional[float] = None
+
 class DiscoverRequest(BaseModel):
     category: str
     latitude: float
     longitude: float
 
+class DiscoverBatchRequest(BaseModel):
+    categories: List[str]
+    latitude: float
+    longitude: float
+
 class Place(BaseModel):
     name: str
     address: str
@@ -37,3 +56,6 @@ class ContactRequest(BaseModel):
 
 class DiscoverResponse(BaseModel):
     places: List[Place]
+
+class DiscoverBatchResponse(BaseModel):
+    results: Dict[str, List[Place]]   # keyed by category, in request order
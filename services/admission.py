@@ -0,0 +1,94 @@
+import os
+import time
+import contextvars
+from collections import deque
+from dotenv import load_dotenv
+from services.metrics import inc
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+
+# Past this many requests in flight on one endpoint, new ones are served degraded:
+# cached places only and the template reply instead of Gemini
+ADMISSION_DEGRADE_IN_FLIGHT = int(os.getenv("ADMISSION_DEGRADE_IN_FLIGHT", "64"))
+# Past this many, new requests are turned away with a 503 straight away
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256"))
+# Requests are also degraded while an endpoint's recent p95 is above this many seconds
+ADMISSION_TARGET_LATENCY = float(os.getenv("ADMISSION_TARGET_LATENCY", "10.0"))
+# Only full (non-degraded) requests finished this recently count towards the p95, so
+# once an endpoint has been degraded for this long it goes back to trying full requests
+ADMISSION_WINDOW = float(os.getenv("ADMISSION_WINDOW", "30"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+ADMISSION_MIN_SAMPLES = 10
+LATENCY_WINDOW = 200
+
+# Routes under admission control; status and metrics endpoints are always served
+ADMISSION_ROUTES = {
+    "/api/chat": "chat",
+    "/api/chat/stream": "chat_stream",
+    "/api/session/message": "session_message",
+    "/api/discover": "discover",
+    "/api/discover/batch": "discover_batch",
+}
+
+_degraded = contextvars.ContextVar("degraded", default=False)
+_in_flight = {}
+_latencies = {}
+
+class OverloadedError(Exception):
+    pass
+
+def degraded():
+    """True while the current request is being served in degraded mode"""
+    return _degraded.get()
+
+def _recent_p95(endpoint, now):
+    samples = _latencies.get(endpoint)
+    if not samples:
+        return None
+    recent = sorted(seconds for finished, seconds in samples if now - finished <= ADMISSION_WINDOW)
+    if len(recent) < ADMISSION_MIN_SAMPLES:
+        return None
+    return recent[int(len(recent) * 0.95) - 1]
+
+def _should_degrade(in_flight, p95):
+    return in_flight >= ADMISSION_DEGRADE_IN_FLIGHT or (p95 is not None and p95 > ADMISSION_TARGET_LATENCY)
+
+def admit(endpoint):
+    """Start a request, returning its ticket; raises OverloadedError if it must be rejected"""
+    in_flight = _in_flight.get(endpoint, 0)
+    if in_flight >= ADMISSION_MAX_IN_FLIGHT:
+        inc("admission_decisions_total", endpoint=endpoint, decision="rejected")
+        raise OverloadedError(f"{endpoint} has {in_flight} requests in flight")
+
+    now = time.monotonic()
+    is_degraded = _should_degrade(in_flight, _recent_p95(endpoint, now))
+    inc("admission_decisions_total", endpoint=endpoint, decision="degraded" if is_degraded else "admitted")
+
+    _in_flight[endpoint] = in_flight + 1
+    _degraded.set(is_degraded)
+    return {"endpoint": endpoint, "started": now, "degraded": is_degraded}
+
+def finish(ticket):
+    """End a request started by admit, recording its latency if it was served in full"""
+    endpoint = ticket["endpoint"]
+    _in_flight[endpoint] -= 1
+    if not ticket["degraded"]:
+        now = time.monotonic()
+        samples = _latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW))
+        samples.append((now, now - ticket["started"]))
+
+def admission_stats():
+    """In-flight requests, recent p95 and whether new requests would be degraded, per endpoint"""
+    now = time.monotonic()
+    stats = {}
+    for endpoint in ADMISSION_ROUTES.values():
+        in_flight = _in_flight.get(endpoint, 0)
+        p95 = _recent_p95(endpoint, now)
+        stats[endpoint] = {
+            "in_flight": in_flight,
+            "p95": p95,
+            "degraded": _should_degrade(in_flight, p95),
+        }
+    return stats
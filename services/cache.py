@@ -0,0 +1,201 @@
+import os
+import json
+import time
+from cachetools import LRUCache, TTLCache
+from dotenv import load_dotenv
+from services.metrics import record_cache
+
+load_dotenv()
+
+# Places results keyed by (category, geocell). Entries are fresh for the TTL, can
+# be served stale for up to PLACES_MAX_STALENESS more seconds while a refresh
+# runs, and the least recently used cells are evicted once the size bound is reached.
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", "3600"))
+PLACES_MAX_STALENESS = int(os.getenv("PLACES_MAX_STALENESS", "1800"))
+PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", "2048"))
+
+_places_cache = TTLCache(maxsize=PLACES_CACHE_SIZE, ttl=PLACES_CACHE_TTL + PLACES_MAX_STALENESS)
+
+def get_cached_places(category, cell):
+    """Return (places, is_fresh) for a (category, cell) pair, or (None, False) on a miss"""
+    entry = _places_cache.get((category, cell))
+    if entry is None:
+        record_cache("places", "miss")
+        return None, False
+    places, stored_at = entry
+    fresh = time.monotonic() - stored_at < PLACES_CACHE_TTL
+    record_cache("places", "hit" if fresh else "stale")
+    return places, fresh
+
+def set_cached_places(category, cell, places):
+    _places_cache[(category, cell)] = (places, time.monotonic())
+
+# Place Details keyed by place_id. Fields are grouped by how often they change,
+# and each group is refreshed independently once its TTL has passed.
+DETAILS_CACHE_SIZE = int(os.getenv("DETAILS_CACHE_SIZE", "20000"))
+DETAILS_STATIC_TTL = int(os.getenv("DETAILS_STATIC_TTL", str(7 * 24 * 3600)))
+DETAILS_SLOW_TTL = int(os.getenv("DETAILS_SLOW_TTL", str(6 * 3600)))
+DETAILS_HOURS_TTL = int(os.getenv("DETAILS_HOURS_TTL", str(24 * 3600)))
+# Used instead of DETAILS_HOURS_TTL when a place has no weekly periods to compute open_now from
+DETAILS_OPEN_NOW_TTL = int(os.getenv("DETAILS_OPEN_NOW_TTL", "900"))
+
+DETAILS_FIELD_GROUPS = {
+    "static": ["formatted_phone_number", "geometry"],
+    "slow": ["rating", "user_ratings_total"],
+    "hours": ["opening_hours", "utc_offset"],
+}
+
+_details_cache = LRUCache(maxsize=DETAILS_CACHE_SIZE)
+
+def _group_ttl(group, fields):
+    if group == "static":
+        return DETAILS_STATIC_TTL
+    if group == "slow":
+        return DETAILS_SLOW_TTL
+    if fields.get("opening_hours", {}).get("periods"):
+        return DETAILS_HOURS_TTL
+    return DETAILS_OPEN_NOW_TTL
+
+def get_cached_details(place_id):
+    """Return (cached fields, field groups that are missing or expired) for a place"""
+    entry = _details_cache.get(place_id)
+    if entry is None:
+        record_cache("details", "miss")
+        return {}, list(DETAILS_FIELD_GROUPS)
+
+    now = time.time()
+    stale = []
+    for group in DETAILS_FIELD_GROUPS:
+        fetched_at = entry["fetched_at"].get(group)
+        if fetched_at is None or now - fetched_at > _group_ttl(group, entry["fields"]):
+            stale.append(group)
+
+    record_cache("details", "partial" if stale else "hit")
+    return dict(entry["fields"]), stale
+
+def set_cached_details(place_id, groups, result):
+    """Store freshly fetched fields for the given groups"""
+    entry = _details_cache.get(place_id) or {"fields": {}, "fetched_at": {}}
+    now = time.time()
+
+    for group in groups:
+        # Drop fields Google no longer returns so they aren't served forever
+        for field in DETAILS_FIELD_GROUPS[group]:
+            entry["fields"].pop(field, None)
+        entry["fetched_at"][group] = now
+
+    entry["fields"].update(result)
+    _details_cache[place_id] = entry
+
+# Radius tier that last yielded enough candidates, keyed by (category, coarse geocell)
+RADIUS_HINT_TTL = int(os.getenv("RADIUS_HINT_TTL", str(24 * 3600)))
+RADIUS_HINT_SIZE = int(os.getenv("RADIUS_HINT_SIZE", "10000"))
+
+_radius_hints = TTLCache(maxsize=RADIUS_HINT_SIZE, ttl=RADIUS_HINT_TTL)
+
+def get_radius_hint(category, cell):
+    """Return the learned starting tier index for an area, or None if nothing is known"""
+    return _radius_hints.get((category, cell))
+
+def set_radius_hint(category, cell, tier):
+    _radius_hints[(category, cell)] = tier
+
+# Google reverse-geocode results keyed by geocell; addresses rarely change
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(7 * 24 * 3600)))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "50000"))
+
+_geocode_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, ttl=GEOCODE_CACHE_TTL)
+
+def get_cached_location(cell):
+    location_info = _geocode_cache.get(cell)
+    record_cache("geocode", "miss" if location_info is None else "hit")
+    return location_info
+
+def set_cached_location(cell, location_info):
+    _geocode_cache[cell] = location_info
+
+# Gemini replies keyed by a fingerprint of the prompt inputs, optionally mirrored
+# to disk so common first-turn replies survive restarts
+REPLY_CACHE_TTL = int(os.getenv("REPLY_CACHE_TTL", str(6 * 3600)))
+REPLY_CACHE_SIZE = int(os.getenv("REPLY_CACHE_SIZE", "5000"))
+REPLY_CACHE_DIR = os.getenv("REPLY_CACHE_DIR")
+# The disk mirror is swept for expired and excess files after this many writes
+REPLY_PRUNE_EVERY = 100
+
+_reply_cache = TTLCache(maxsize=REPLY_CACHE_SIZE, ttl=REPLY_CACHE_TTL)
+
+def get_cached_reply(key):
+    """Return a cached reply for a fingerprint, checking disk after memory (blocking when disk is enabled)"""
+    reply = _reply_cache.get(key)
+    if reply is not None or not REPLY_CACHE_DIR:
+        record_cache("reply", "miss" if reply is None else "hit")
+        return reply
+
+    path = os.path.join(REPLY_CACHE_DIR, f"{key}.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        record_cache("reply", "miss")
+        return None
+
+    if time.time() - entry["created_at"] > REPLY_CACHE_TTL:
+        record_cache("reply", "miss")
+        _remove_reply_file(path)
+        return None
+    record_cache("reply", "disk_hit")
+    _reply_cache[key] = entry["reply"]
+    return entry["reply"]
+
+def _remove_reply_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def prune_reply_dir():
+    """Delete expired reply files, then the oldest ones beyond REPLY_CACHE_SIZE (blocking)"""
+    try:
+        entries = [e for e in os.scandir(REPLY_CACHE_DIR) if e.name.endswith(".json")]
+    except OSError:
+        return
+
+    cutoff = time.time() - REPLY_CACHE_TTL
+    kept = []
+    for entry in entries:
+        try:
+            modified = entry.stat().st_mtime
+        except OSError:
+            continue
+        if modified < cutoff:
+            _remove_reply_file(entry.path)
+        else:
+            kept.append((modified, entry.path))
+
+    kept.sort()
+    for _, path in kept[:max(0, len(kept) - REPLY_CACHE_SIZE)]:
+        _remove_reply_file(path)
+
+_reply_writes = 0
+
+def set_cached_reply(key, reply):
+    global _reply_writes
+    _reply_cache[key] = reply
+    if not REPLY_CACHE_DIR:
+        return
+
+    try:
+        os.makedirs(REPLY_CACHE_DIR, exist_ok=True)
+        path = os.path.join(REPLY_CACHE_DIR, f"{key}.json")
+        # Write then rename so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"reply": reply, "created_at": time.time()}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Reply cache write error: {e}")
+
+    # The directory is held to the same TTL and size bound as the memory cache
+    _reply_writes += 1
+    if _reply_writes % REPLY_PRUNE_EVERY == 0:
+        prune_reply_dir()
@@ -2,23 +2,35 @@ import os
 import resend
 
 resend.api_key = os.getenv("RESEND_API_KEY")
+# Seconds before a Resend call gives up; must stay below OUTBOX_LEASE_SECONDS
+EMAIL_SEND_TIMEOUT = int(os.getenv("EMAIL_SEND_TIMEOUT", "20"))
+resend.default_http_client = resend.RequestsClient(timeout=EMAIL_SEND_TIMEOUT)
 
 SMTP_TO = os.getenv("SMTP_TO")  
 
-def send_contact_email(name: str, email: str, subject: str, message: str):
+def build_contact_params(name: str, email: str, subject: str, message: str):
     body = f"Name: {name}\nEmail: {email}\n\nMessage:\n{message}"
     
+    return {
+        "from": "onboarding@resend.dev",  # ← Changed this to Resend's test domain
+        "to": [SMTP_TO],
+        "subject": subject,
+        "text": body,
+        "reply_to": email
+    }
+
+def send_email(params):
+    """Send one prepared email (blocking)"""
+    try:
+        return resend.Emails.send(params)
+    except Exception as e:
+        print(f"Error: {e}")
+        raise
+
+def send_email_batch(params_list):
+    """Send up to 100 prepared emails in one Resend call (blocking)"""
     try:
-        params = {
-            "from": "onboarding@resend.dev",  # ← Changed this to Resend's test domain
-            "to": [SMTP_TO],
-            "subject": subject,
-            "text": body,
-            "reply_to": email
-        }
-        
-        response = resend.Emails.send(params)
-        return response
+        return resend.Batch.send(params_list)
     except Exception as e:
         print(f"Error: {e}")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,98 @@
+import os
+import math
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# GeoNames-style dumps: a cities file (e.g. cities1000.txt) plus optional
+# admin1CodesASCII.txt and countryInfo.txt to turn codes into names
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+GAZETTEER_ADMIN1_PATH = os.getenv("GAZETTEER_ADMIN1_PATH")
+GAZETTEER_COUNTRIES_PATH = os.getenv("GAZETTEER_COUNTRIES_PATH")
+
+# Callers further than this from every known city are treated as a miss
+GAZETTEER_MAX_KM = float(os.getenv("GAZETTEER_MAX_KM", "25"))
+
+# Grid cell size in degrees; a lookup scans the caller's cell and its neighbours
+GRID_DEGREES = 0.5
+
+_grid = {}
+_loaded = False
+
+def _grid_key(lat, lon):
+    return (math.floor(lat / GRID_DEGREES), math.floor(lon / GRID_DEGREES))
+
+def _read_names(path, key_col, name_col):
+    names = {}
+    if not path or not os.path.exists(path):
+        return names
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) > max(key_col, name_col):
+                names[cols[key_col]] = cols[name_col]
+    return names
+
+def load_gazetteer():
+    """Load the local city index; a missing file just leaves offline geocoding disabled"""
+    global _loaded
+    if _loaded or not GAZETTEER_PATH or not os.path.exists(GAZETTEER_PATH):
+        return _loaded
+
+    admin1 = _read_names(GAZETTEER_ADMIN1_PATH, 0, 1)
+    countries = _read_names(GAZETTEER_COUNTRIES_PATH, 0, 4)
+
+    with open(GAZETTEER_PATH, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 11:
+                continue
+            try:
+                lat, lon = float(cols[4]), float(cols[5])
+            except ValueError:
+                continue
+
+            country_code = cols[8]
+            _grid.setdefault(_grid_key(lat, lon), []).append((
+                lat,
+                lon,
+                cols[1],
+                admin1.get(f"{country_code}.{cols[10]}", cols[10] or None),
+                countries.get(country_code, country_code or None),
+            ))
+
+    _loaded = True
+    return _loaded
+
+def nearest_city(lat, lon):
+    """Return city/state/country for the closest gazetteer entry, or None on a miss"""
+    if not _loaded:
+        return None
+
+    row, col = _grid_key(lat, lon)
+    cos_lat = math.cos(math.radians(lat))
+    best = None
+    best_km = GAZETTEER_MAX_KM
+
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            for entry in _grid.get((row + dr, col + dc), ()):
+                # Equirectangular distance is accurate enough at city scale
+                dx = math.radians(entry[1] - lon) * cos_lat
+                dy = math.radians(entry[0] - lat)
+                km = 6371 * math.hypot(dx, dy)
+                if km <= best_km:
+                    best, best_km = entry, km
+
+    if best is None:
+        return None
+
+    _, _, city, state, country = best
+    return {
+        "city": city,
+        "state": state,
+        "country": country,
+        "formatted": ", ".join(part for part in (city, state, country) if part)
+    }
@@ -1,11 +1,25 @@
 # services/gemini.py
 
 from google import genai
+from google.genai import types
 from dotenv import load_dotenv
+from services.admission import degraded
+from services.cache import get_cached_reply, set_cached_reply
+from services.metrics import inc, observe, record_upstream, span
+import asyncio
+import hashlib
+import math
 import os
+import re
+import time
 
 load_dotenv()
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# GEMINI_BASE_URL points the client at a stand-in server (see bench/)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+client = genai.Client(
+    api_key=os.getenv("GEMINI_API_KEY"),
+    http_options=types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+)
 
 # Updated to match places.py categories
 CATEGORY_DESC = {
@@ -21,12 +35,76 @@ CATEGORY_DESC = {
     "EMERGENCY": "Emergency services including hospitals, police, fire departments, crisis centers, and urgent care"
 }
 
-def generate_reply(messages, location_info, places, age_group, service_type):
-    """Generate AI response with strict app-focused guidelines"""
-    
-    # Build conversation history
-    conversation = "\n".join([f"{m.role.upper()}: {m.content}" for m in messages])
+# Token budget for conversation history in the prompt; older turns beyond it are
+# condensed into one-line extracts capped at PROMPT_SUMMARY_TOKENS
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "1500"))
+PROMPT_SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS", "300"))
+SUMMARY_LINE_CHARS = 160
+
+# Shared generation settings for full and streamed replies
+GENERATION_MODEL = "gemini-1.5-pro"  # Most reliable for instruction following
+GENERATION_CONFIG = {
+    "temperature": 0.8,
+    "top_p": 0.95,
+    "max_output_tokens": 1000,
+}
 
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+def summarize_turn(message):
+    """One-line extract of an older user turn, cut at a word boundary"""
+    text = " ".join(message.content.split())
+    if len(text) <= SUMMARY_LINE_CHARS:
+        return text
+    return text[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + "..."
+
+def summarize_older_turns(older):
+    """Summary lines for older turns, one per user message"""
+    # Assistant turns are mostly resource lists the new prompt repeats anyway
+    return [summarize_turn(m) for m in older if m.role == "user"]
+
+def compact_history(messages):
+    """Conversation text within PROMPT_HISTORY_TOKENS: latest turns verbatim, older ones summarized"""
+    recent = []
+    used = 0
+    for m in reversed(messages):
+        line = f"{m.role.upper()}: {m.content}"
+        cost = estimate_tokens(line)
+        # The latest message is always kept whole
+        if recent and used + cost > PROMPT_HISTORY_TOKENS:
+            break
+        recent.append(line)
+        used += cost
+    recent.reverse()
+
+    older = messages[:len(messages) - len(recent)]
+    if not older:
+        return "\n".join(recent)
+
+    summary = []
+    summary_used = 0
+    for line in reversed(summarize_older_turns(older)):
+        cost = estimate_tokens(line)
+        if summary_used + cost > PROMPT_SUMMARY_TOKENS:
+            break
+        summary.append(f"- {line}")
+        summary_used += cost
+    summary.reverse()
+
+    header = f"[{len(older)} earlier messages condensed]"
+    if summary:
+        header += "\nEarlier, the user said:\n" + "\n".join(summary)
+    return header + "\n" + "\n".join(recent)
+
+def rounded_distance(distance):
+    """Distance as shown in replies, in coarse steps so nearby callers share cached replies"""
+    step = 0.5 if distance < 5 else 1.0
+    return f"about {max(step, math.ceil(distance / step) * step):g}"
+
+def format_places(places, age_group):
+    """Render the places list with age-appropriate detail"""
     # Format places list with AGE-APPROPRIATE restrictions
     if places:
         place_list = []
@@ -47,20 +125,20 @@ def generate_reply(messages, location_info, places, age_group, service_type):
                 # Only name and address - NO phone or directions
                 place_list.append(
                     f"**{i}. {p['name']}**{rating}{open_status}  \n"
-                    f"📍 {p['address']} ({p['distance_miles']} km away)"
+                    f"📍 {p['address']} ({rounded_distance(p['distance_miles'])} km away)"
                 )
             elif age_group == "10-12":
                 # Full info including directions, but will ask parent to go with them
                 place_list.append(
                     f"**{i}. {p['name']}**{rating}{open_status}  \n"
-                    f"📍 {p['address']} ({p['distance_miles']} km away){phone}  \n"
+                    f"📍 {p['address']} ({rounded_distance(p['distance_miles'])} km away){phone}  \n"
                     f"🗺️ [Get Directions]({p['maps_url']})"
                 )
             else:  # 13-17 and 18+
                 # Full information
                 place_list.append(
                     f"**{i}. {p['name']}**{rating}{open_status}  \n"
-                    f"📍 {p['address']} ({p['distance_miles']} km away){phone}  \n"
+                    f"📍 {p['address']} ({rounded_distance(p['distance_miles'])} km away){phone}  \n"
                     f"🗺️ [Get Directions]({p['maps_url']})"
                 )
         
@@ -68,6 +146,23 @@ def generate_reply(messages, location_info, places, age_group, service_type):
     else:
         place_text = "Unfortunately, no specific resources were found in your immediate area."
 
+    return place_text
+
+def format_place_sections(places, related, age_group):
+    """Places for the main need, followed by a shorter section for each additional need"""
+    place_text = format_places(places, age_group)
+    for category, extra in (related or {}).items():
+        if extra:
+            label = category.replace('_', ' ').lower()
+            place_text += f"\n\n**Also nearby for {label}:**\n\n{format_places(extra[:3], age_group)}"
+    return place_text
+
+def build_prompt(messages, location_info, place_text, age_group, service_type):
+    """Build the age-specific Gemini prompt"""
+    
+    # Build conversation history, compacted to the prompt token budget
+    conversation = compact_history(messages)
+
     # Simplified, more direct prompt based on age
     if age_group == "0-3":
         prompt = f"""You are helping a PARENT/GUARDIAN seeking {service_type.replace('_', ' ').lower()} for their young child (age 0-3).
@@ -231,30 +326,14 @@ RESPONSE STRUCTURE (MANDATORY):
 
 Generate response:"""
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-1.5-pro",  # Most reliable for instruction following
-            contents=prompt,
-            config={
-                "temperature": 0.8,
-                "top_p": 0.95,
-                "max_output_tokens": 1000,
-            }
-        )
-        
-        # Check if response was generated
-        if response and response.text:
-            return response.text.strip()
-        else:
-            raise Exception("Empty response from Gemini")
-            
-    except Exception as e:
-        print(f"Gemini API Error: {e}")
-        print(f"Age group: {age_group}, Service: {service_type}")
-        
-        # Better age-appropriate fallback
-        if age_group in ["0-3", "4-9"]:
-            return f"""I see you're seeking {service_type.lower().replace('_', ' ')} help for your child.
+    return prompt
+
+def fallback_reply(places, place_text, age_group, service_type):
+    """Template reply used when Gemini is unavailable"""
+    
+    # Better age-appropriate fallback
+    if age_group in ["0-3", "4-9"]:
+        return f"""I see you're seeking {service_type.lower().replace('_', ' ')} help for your child.
 
 {CATEGORY_DESC.get(service_type, 'These services can provide the support your family needs.')}
 
@@ -268,9 +347,9 @@ Generate response:"""
 - Most services are free or low-cost for families in need
 
 You're taking an important step in supporting your child. Let me know if you need help with anything else."""
-        
-        elif age_group in ["10-12", "13-17"]:
-            return f"""I understand you need {service_type.lower().replace('_', ' ')} support.
+    
+    elif age_group in ["10-12", "13-17"]:
+        return f"""I understand you need {service_type.lower().replace('_', ' ')} support.
 
 {CATEGORY_DESC.get(service_type, 'These services can help you.')}
 
@@ -284,9 +363,9 @@ You're taking an important step in supporting your child. Let me know if you nee
 - Bring any ID or documents if you have them
 
 You're being responsible by seeking help. Let me know if you have questions."""
-        
-        else:  # 18+
-            return f"""I understand you need {service_type.lower().replace('_', ' ')} support.
+    
+    else:  # 18+
+        return f"""I understand you need {service_type.lower().replace('_', ' ')} support.
 
 {CATEGORY_DESC.get(service_type, 'These services can provide assistance.')}
 
@@ -299,4 +378,125 @@ You're being responsible by seeking help. Let me know if you have questions."""
 2. Ask about their intake process and requirements
 3. Prepare any necessary documents (ID, proof of residency, etc.)
 
-You deserve support. Let me know if you need help with anything else."""
\ No newline at end of file
+You deserve support. Let me know if you need help with anything else."""
+
+def reply_fingerprint(messages, location_info, place_text, age_group, service_type):
+    """Cache key for a first-turn reply, or None for multi-turn conversations
+
+    The key covers the rendered place list itself, so a reply is only reused when
+    it would show the same places, open/closed status and rounded distances.
+    """
+    if len(messages) != 1 or messages[0].role != "user":
+        return None
+
+    # Case, punctuation and spacing don't change what the user asked for
+    text = " ".join(re.sub(r"[^\w\s]", " ", messages[0].content.lower()).split())
+    parts = [
+        service_type,
+        age_group,
+        location_info.get("city") or location_info.get("formatted", ""),
+        place_text,
+        text,
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+async def prepare_reply(messages, location_info, places, age_group, service_type, related):
+    """Format the places and settle the reply without Gemini where possible
+
+    Returns (place_text, cache_key, ready): ready is ("token", text) for a cached
+    reply, ("fallback", text) for the template reply while load is being shed,
+    or None when Gemini has to be called.
+    """
+    place_text = format_place_sections(places, related, age_group)
+    cache_key = reply_fingerprint(messages, location_info, place_text, age_group, service_type)
+    if cache_key:
+        # May read from disk, so keep it off the event loop
+        cached = await asyncio.to_thread(get_cached_reply, cache_key)
+        if cached:
+            return place_text, cache_key, ("token", cached)
+
+    if degraded():
+        # Shedding load: the template reply lists the same places without a model call
+        inc("upstream_requests_total", endpoint="gemini", outcome="shed")
+        return place_text, cache_key, ("fallback", fallback_reply(places, place_text, age_group, service_type))
+
+    return place_text, cache_key, None
+
+def gemini_failed(error, start, places, place_text, age_group, service_type):
+    """Record a failed Gemini call and return the template reply in its place"""
+    record_upstream("gemini", time.monotonic() - start, "error")
+    print(f"Gemini API Error: {error}")
+    print(f"Age group: {age_group}, Service: {service_type}")
+    return fallback_reply(places, place_text, age_group, service_type)
+
+async def generate_reply_async(messages, location_info, places, age_group, service_type, related=None):
+    """Generate AI response with strict app-focused guidelines, using the async Gemini client"""
+    
+    place_text, cache_key, ready = await prepare_reply(
+        messages, location_info, places, age_group, service_type, related
+    )
+    if ready:
+        return ready[1]
+    prompt = build_prompt(messages, location_info, place_text, age_group, service_type)
+
+    start = time.monotonic()
+    try:
+        with span("gemini"):
+            response = await client.aio.models.generate_content(
+                model=GENERATION_MODEL,
+                contents=prompt,
+                config=GENERATION_CONFIG
+            )
+        
+        if response and response.text:
+            record_upstream("gemini", time.monotonic() - start, "ok")
+            reply = response.text.strip()
+            if cache_key:
+                await asyncio.to_thread(set_cached_reply, cache_key, reply)
+            return reply
+        else:
+            raise Exception("Empty response from Gemini")
+            
+    except Exception as e:
+        return gemini_failed(e, start, places, place_text, age_group, service_type)
+
+async def stream_reply(messages, location_info, places, age_group, service_type, related=None):
+    """Stream the reply as ("token", text) events, ending with ("fallback", text) if Gemini fails"""
+    
+    place_text, cache_key, ready = await prepare_reply(
+        messages, location_info, places, age_group, service_type, related
+    )
+    if ready:
+        yield ready
+        return
+    prompt = build_prompt(messages, location_info, place_text, age_group, service_type)
+
+    start = time.monotonic()
+    try:
+        stream = await client.aio.models.generate_content_stream(
+            model=GENERATION_MODEL,
+            contents=prompt,
+            config=GENERATION_CONFIG
+        )
+        
+        chunks = []
+        async for chunk in stream:
+            if chunk.text:
+                if not chunks:
+                    observe("stage_duration_seconds", time.monotonic() - start, stage="gemini_first_token")
+                chunks.append(chunk.text)
+                yield "token", chunk.text
+        
+        if not chunks:
+            raise Exception("Empty response from Gemini")
+        
+        elapsed = time.monotonic() - start
+        observe("stage_duration_seconds", elapsed, stage="gemini")
+        record_upstream("gemini", elapsed, "ok")
+        
+        if cache_key:
+            await asyncio.to_thread(set_cached_reply, cache_key, "".join(chunks).strip())
+            
+    except Exception as e:
+        # Clients replace any partial text with the complete template reply
+        yield "fallback", gemini_failed(e, start, places, place_text, age_group, service_type)
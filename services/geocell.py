@@ -0,0 +1,78 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Precision 6 cells are roughly 1.2km x 0.6km - small enough that re-ranking
+# cached places against the caller's exact position stays accurate
+GEOHASH_PRECISION = int(os.getenv("GEOHASH_PRECISION", "6"))
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    """Encode a coordinate into a geohash cell id of the given length"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    cell = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(cell) < precision:
+        # Geohash interleaves longitude and latitude bits, starting with longitude
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            cell.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(cell)
+
+def cell_size(precision=GEOHASH_PRECISION):
+    """(height, width) of a geohash cell in degrees"""
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+def cells_in_bbox(south, west, north, east, precision=GEOHASH_PRECISION):
+    """Centre coordinates of every geohash cell overlapping a bounding box"""
+    height, width = cell_size(precision)
+    cells = {}
+    lat = south
+    while lat <= north + height:
+        lon = west
+        while lon <= east + width:
+            cell = geohash(min(lat, north), min(lon, east), precision)
+            if cell not in cells:
+                cells[cell] = cell_center(cell)
+            lon += width
+        lat += height
+    return cells
+
+def cell_center(cell):
+    """Centre coordinate of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for ch in cell:
+        bits = _BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if bits >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
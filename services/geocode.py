@@ -1,23 +1,74 @@
-import httpx
 import os
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
+from services.admission import degraded
+from services.cache import get_cached_location, set_cached_location
+from services.gazetteer import nearest_city
+from services.geocell import geohash
+from services.metrics import record_cache, span
+from services.resilience import guarded_call, UpstreamStatusError, UPSTREAM_ERROR_STATUSES
+from services.singleflight import coalesce
+from services.upstream import get_client, MAPS_BASE_URL
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-async def reverse_geocode_async(lat, lon):
-    """Async version for better performance"""
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lon}&key={GOOGLE_API_KEY}"
+# Precision 7 cells are roughly 150m across - plenty for city/state/country context
+GEOCODE_PRECISION = int(os.getenv("GEOCODE_PRECISION", "7"))
+
+# "offline_first" answers from the local gazetteer when it has a city nearby and only
+# calls Google on a miss; "google_first" uses the gazetteer only when Google fails
+GEOCODE_MODE = os.getenv("GEOCODE_MODE", "offline_first")
+
+async def reverse_geocode_async(lat, lon, precise=False):
+    """Async version for better performance; pass precise=True to require a street-level address"""
+    with span("geocode"):
+        return await _reverse_geocode(lat, lon, precise)
+
+async def _reverse_geocode(lat, lon, precise):
+    cell = geohash(lat, lon, GEOCODE_PRECISION)
+    cached = get_cached_location(cell)
+    if cached is not None:
+        return cached
+
+    # City/state/country from the local index is enough for prompt context
+    if not precise and GEOCODE_MODE == "offline_first":
+        local = nearest_city(lat, lon)
+        record_cache("gazetteer", "hit" if local else "miss")
+        if local:
+            return local
+
+    # Shedding load: city-level context from the gazetteer is good enough
+    if degraded():
+        return nearest_city(lat, lon) or {"formatted": f"Location: {lat}, {lon}"}
+
+    # Concurrent lookups from the same spot share one Geocoding call
+    location_info = await coalesce(("geocode", cell), lambda: fetch_reverse_geocode(lat, lon))
+    if location_info:
+        set_cached_location(cell, location_info)
+        return location_info
+
+    # Google is slow, failing or out of quota - the gazetteer keeps chat working
+    return nearest_city(lat, lon) or {"formatted": f"Location: {lat}, {lon}"}
+
+async def fetch_reverse_geocode(lat, lon):
+    """Google reverse geocode, or None if the call fails or finds nothing"""
+    url = f"{MAPS_BASE_URL}/maps/api/geocode/json?latlng={lat},{lon}&key={GOOGLE_API_KEY}"
     
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        try:
-            response = await client.get(url)
-            data = response.json()
-        except:
-            return {"formatted": f"Location: {lat}, {lon}"}
+    async def request():
+        response = await get_client("geocode").get(url)
+        data = response.json()
+        if data.get("status") in UPSTREAM_ERROR_STATUSES:
+            raise UpstreamStatusError(data["status"])
+        return data
+
+    try:
+        data = await guarded_call("geocode", request)
+    except Exception:
+        return None
 
     if not data.get("results"):
-        return {"formatted": f"Location: {lat}, {lon}"}
+        return None
 
     comp = data["results"][0]["address_components"]
 
@@ -34,31 +85,24 @@ async def reverse_geocode_async(lat, lon):
         "formatted": data["results"][0]["formatted_address"]
     }
 
-# Synchronous version for backward compatibility
-def reverse_geocode(lat, lon):
-    """Synchronous version - consider migrating to async"""
-    import requests
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lon}&key={GOOGLE_API_KEY}"
-    
-    try:
-        data = requests.get(url, timeout=5).json()
-    except:
-        return {"formatted": f"Location: {lat}, {lon}"}
+async def geocode_bounds(address):
+    """Forward geocode an address or city name to its (south, west, north, east) viewport, or None"""
+    url = f"{MAPS_BASE_URL}/maps/api/geocode/json?address={quote_plus(address)}&key={GOOGLE_API_KEY}"
 
-    if not data.get("results"):
-        return {"formatted": f"Location: {lat}, {lon}"}
+    async def request():
+        response = await get_client("geocode").get(url)
+        return response.json()
 
-    comp = data["results"][0]["address_components"]
+    try:
+        data = await guarded_call("geocode", request)
+    except Exception:
+        return None
 
-    def get(types):
-        for c in comp:
-            if any(t in c["types"] for t in types):
-                return c["long_name"]
+    if not data.get("results"):
         return None
 
-    return {
-        "city": get(["locality"]),
-        "state": get(["administrative_area_level_1"]),
-        "country": get(["country"]),
-        "formatted": data["results"][0]["formatted_address"]
-    }
\ No newline at end of file
+    viewport = data["results"][0]["geometry"]["viewport"]
+    return (
+        viewport["southwest"]["lat"], viewport["southwest"]["lng"],
+        viewport["northeast"]["lat"], viewport["northeast"]["lng"]
+    )
@@ -1,63 +1,97 @@
-def classify_service_type(message: str) -> str:
-    """Enhanced intent classification with better keyword matching"""
-    message = message.lower()
-
-    # Priority-ordered keywords (more specific first)
-    KEYWORDS = {
-        "MENTAL_HEALTH": [
-            "mental health", "therapy", "therapist", "stress", "anxiety", "depression",
-            "counseling", "counselor", "addiction", "rehab", "suicide", "crisis",
-            "psychological", "psychiatric", "ptsd", "trauma", "emotional support"
-        ],
-        "SHELTER": [
-            "shelter", "homeless", "place to stay", "need bed", "housing",
-            "night shelter", "sleep tonight", "roof", "emergency housing",
-            "domestic violence", "safe house", "transitional housing"
-        ],
-        "MEDICAL": [  # Changed from HEALTHCARE to match places.py
-            "hospital", "doctor", "clinic", "medicine", "health", "medical",
-            "injury", "sick", "ill", "pain", "emergency room", "urgent care",
-            "dentist", "dental", "pharmacy", "prescription", "treatment"
-        ],
-        "FOOD": [
-            "food", "hungry", "meal", "eat", "grocery", "ration",
-            "pantry", "food bank", "soup kitchen", "starving", "feed",
-            "breakfast", "lunch", "dinner", "nutrition"
-        ],
-        "LEGAL": [
-            "lawyer", "legal aid", "attorney", "court", "advocate", "immigration",
-            "documents", "paperwork", "visa", "asylum", "legal help",
-            "eviction", "custody", "rights"
-        ],
-        "FINANCIAL": [
-            "money", "loan", "finance", "bills", "credit", "debt",
-            "emergency funds", "financial aid", "cash assistance",
-            "rent help", "utility assistance", "broke", "poor"
-        ],
-        "EDUCATION": [
-            "school", "college", "study", "education", "learn",
-            "training", "courses", "skills", "literacy", "ged",
-            "vocational", "job training", "certificate"
-        ],
-        "TRANSPORTATION": [
-            "bus", "train", "taxi", "transport", "ride", "mobility",
-            "metro", "subway", "transit", "get to", "travel"
-        ],
-        "COMMUNITY_NGOS": [  # Changed from COMMUNITY to match places.py
-            "ngo", "community center", "charity", "support group",
-            "youth center", "senior center", "community service",
-            "nonprofit", "volunteer", "outreach"
-        ],
-        "EMERGENCY": [
-            "emergency", "urgent", "crisis", "911", "immediate help",
-            "danger", "threat", "abuse", "violence", "life threatening"
-        ]
-    }
-
-    # Check each category in priority order
-    for category, keywords in KEYWORDS.items():
-        if any(keyword in message for keyword in keywords):
-            return category
-
-    # Default fallback
-    return "FOOD"
\ No newline at end of file
+import os
+from dotenv import load_dotenv
+from services.matcher import TermMatcher
+from services.metrics import span
+
+load_dotenv()
+
+# How many matched categories a chat turn looks up places for at once
+INTENT_MAX_CATEGORIES = int(os.getenv("INTENT_MAX_CATEGORIES", "2"))
+
+# Priority-ordered keywords (more specific first)
+KEYWORDS = {
+    "MENTAL_HEALTH": [
+        "mental health", "therapy", "therapist", "stress", "anxiety", "depression",
+        "counseling", "counselor", "addiction", "rehab", "suicide", "crisis",
+        "psychological", "psychiatric", "ptsd", "trauma", "emotional support"
+    ],
+    "SHELTER": [
+        "shelter", "homeless", "place to stay", "need bed", "housing",
+        "night shelter", "sleep tonight", "roof", "emergency housing",
+        "domestic violence", "safe house", "transitional housing",
+        "nowhere to sleep", "nowhere to stay", "place to sleep", "somewhere to sleep",
+        "need a bed", "sleeping outside", "sleeping rough", "kicked out"
+    ],
+    "MEDICAL": [  # Changed from HEALTHCARE to match places.py
+        "hospital", "doctor", "clinic", "medicine", "health", "medical",
+        "injury", "sick", "ill", "pain", "emergency room", "urgent care",
+        "dentist", "dental", "pharmacy", "prescription", "treatment"
+    ],
+    "FOOD": [
+        "food", "hungry", "meal", "eat", "grocery", "ration",
+        "pantry", "food bank", "soup kitchen", "starving", "feed",
+        "breakfast", "lunch", "dinner", "nutrition"
+    ],
+    "LEGAL": [
+        "lawyer", "legal aid", "attorney", "court", "advocate", "immigration",
+        "documents", "paperwork", "visa", "asylum", "legal help",
+        "eviction", "custody", "rights"
+    ],
+    "FINANCIAL": [
+        "money", "loan", "finance", "bills", "credit", "debt",
+        "emergency funds", "financial aid", "cash assistance",
+        "rent help", "utility assistance", "broke", "poor"
+    ],
+    "EDUCATION": [
+        "school", "college", "study", "education", "learn",
+        "training", "courses", "skills", "literacy", "ged",
+        "vocational", "job training", "certificate"
+    ],
+    "TRANSPORTATION": [
+        "bus", "train", "taxi", "transport", "ride", "mobility",
+        "metro", "subway", "transit", "get to", "travel"
+    ],
+    "COMMUNITY_NGOS": [  # Changed from COMMUNITY to match places.py
+        "ngo", "community center", "charity", "support group",
+        "youth center", "senior center", "community service",
+        "nonprofit", "volunteer", "outreach"
+    ],
+    "EMERGENCY": [
+        "emergency", "urgent", "crisis", "911", "immediate help",
+        "danger", "threat", "threatening", "threatened", "abuse", "violence", "life threatening"
+    ]
+}
+
+# Built once at import: every keyword across all categories in one compiled matcher.
+# Keywords must start a word - each extra category costs a places lookup, so "eat"
+# inside "threatening" must not add FOOD - but may be inflected ("stressed", "urgently")
+KEYWORD_MATCHER = TermMatcher([k for keywords in KEYWORDS.values() for k in keywords], words=True)
+KEYWORD_CATEGORIES = {}
+for category, keywords in KEYWORDS.items():
+    for keyword in keywords:
+        KEYWORD_CATEGORIES.setdefault(keyword, set()).add(category)
+
+def rank_service_types(message: str, limit: int = INTENT_MAX_CATEGORIES) -> list:
+    """Matched categories as (category, score) pairs, best first, at most `limit` of them
+
+    The category the priority order picks always leads, so a crisis keyword is
+    never outranked; the rest follow by score, where a multi-word phrase counts
+    once per word. Returns an empty list when nothing matched.
+    """
+    scores = {}
+    with span("intent"):
+        for keyword in KEYWORD_MATCHER.find(message):
+            weight = len(keyword.split())
+            for category in KEYWORD_CATEGORIES[keyword]:
+                scores[category] = scores.get(category, 0) + weight
+
+    if not scores:
+        return []
+
+    order = list(KEYWORDS)
+    primary = next(category for category in order if category in scores)
+    rest = sorted(
+        (category for category in scores if category != primary),
+        key=lambda category: (-scores[category], order.index(category))
+    )
+    return [(category, scores[category]) for category in [primary] + rest][:limit]
@@ -0,0 +1,57 @@
+import re
+
+def _trie_pattern(terms):
+    """Compile terms into one trie-shaped regex so shared prefixes are only scanned once"""
+    trie = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional: prefer the longest term ending below this node
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class TermMatcher:
+    """Substring matcher for a fixed keyword list, compiled once and run in a single pass
+
+    With words=True terms must start at a word boundary but may run on into a longer
+    word, so "eat" no longer matches inside "threatening" or "ill" inside "will",
+    while "stressed", "urgently" and "illness" still match.
+    """
+
+    def __init__(self, terms, words=False):
+        self.terms = sorted({t.lower() for t in terms if t})
+        trie = _trie_pattern(self.terms)
+        if words:
+            trie = rf"\b{trie}"
+        # The lookahead lets matches overlap, so every start position reports its longest term
+        self._pattern = re.compile(f"(?=({trie}))") if self.terms else None
+        # Shorter terms nested inside a longer match are contained in the text too
+        if words:
+            self._contained = {
+                t: {u for u in self.terms if re.search(rf"\b{re.escape(u)}", t)} for t in self.terms
+            }
+        else:
+            self._contained = {t: {u for u in self.terms if u in t} for t in self.terms}
+
+    def find(self, text):
+        """Return every term that occurs in text"""
+        if self._pattern is None:
+            return set()
+
+        found = set()
+        for match in self._pattern.finditer(text.lower()):
+            found |= self._contained[match.group(1)]
+        return found
+
+    def search(self, text):
+        """True if any term occurs in text"""
+        return self._pattern is not None and self._pattern.search(text.lower()) is not None
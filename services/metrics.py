@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add a Server-Timing header with per-stage durations to every API response
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "false").lower() == "true"
+
+PREFIX = "connectcare"
+
+# Latency buckets in seconds, from cache hits up to a timed-out Gemini call
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_HELP = {
+    "stage_duration_seconds": ("histogram", "Time spent in each stage of a request"),
+    "upstream_request_duration_seconds": ("histogram", "Latency of upstream calls, including hedges"),
+    "upstream_requests_total": ("counter", "Upstream calls by endpoint and outcome"),
+    "upstream_queue_seconds": ("histogram", "Time upstream calls waited for a scheduler slot, by priority class"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result"),
+    "http_request_duration_seconds": ("histogram", "End-to-end API request latency"),
+    "http_requests_total": ("counter", "API requests by route and status code"),
+    "admission_decisions_total": ("counter", "Admission decisions (admitted, degraded, rejected) by endpoint"),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+# Stage timings of the current request, collected for the Server-Timing header
+_timings = ContextVar("timings", default=None)
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        series = _counters.setdefault(name, {})
+        key = _key(labels)
+        series[key] = series.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        key = _key(labels)
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        index = bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            entry["buckets"][index] += 1
+        entry["sum"] += value
+        entry["count"] += 1
+
+def record_cache(cache, result):
+    """Count a cache lookup; result is "hit", "miss", or a cache-specific outcome such as "stale" """
+    inc("cache_requests_total", cache=cache, result=result)
+
+def record_upstream(endpoint, seconds, outcome):
+    observe("upstream_request_duration_seconds", seconds, endpoint=endpoint)
+    inc("upstream_requests_total", endpoint=endpoint, outcome=outcome)
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage of the current request"""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - start
+        observe("stage_duration_seconds", elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+def start_timings():
+    """Begin collecting stage timings for the current request"""
+    timings = []
+    _timings.set(timings)
+    return timings
+
+def server_timing_header(timings, total):
+    # Concurrent or repeated spans of one stage are summed into a single entry
+    merged = {}
+    for stage, elapsed in timings:
+        merged[stage] = merged.get(stage, 0.0) + elapsed
+    entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in merged.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+def cache_hit_ratios():
+    """Share of lookups per cache that were served from it (stale hits included)"""
+    totals = {}
+    with _lock:
+        for labels, count in _counters.get("cache_requests_total", {}).items():
+            labels = dict(labels)
+            hits, lookups = totals.get(labels["cache"], (0, 0))
+            served = count if labels["result"] != "miss" else 0
+            totals[labels["cache"]] = (hits + served, lookups + count)
+    return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def render(gauges=()):
+    """Prometheus text exposition of all recorded metrics plus (name, help, {labels: value}) gauges"""
+    lines = []
+    with _lock:
+        for name, (kind, help_text) in METRIC_HELP.items():
+            full = f"{PREFIX}_{name}"
+            source = _histograms if kind == "histogram" else _counters
+            series = source.get(name)
+            if not series:
+                continue
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in sorted(series.items()):
+                if kind == "counter":
+                    lines.append(f"{full}{_format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, value["buckets"]):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{full}_bucket{_format_labels(labels, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {value['sum']:.6f}")
+                lines.append(f"{full}_count{_format_labels(labels)} {value['count']}")
+
+    for name, help_text, samples in gauges:
+        full = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} gauge")
+        for labels, value in samples.items():
+            lines.append(f"{full}{_format_labels(_key(dict(labels)))} {float(value)}")
+
+    return "\n".join(lines) + "\n"
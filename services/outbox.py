@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from services.email import EMAIL_SEND_TIMEOUT, send_email, send_email_batch
+
+load_dotenv()
+
+# Durable queue of outgoing emails; survives restarts so a slow or failing
+# mail provider never blocks /api/contact or loses a message
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.db")
+# Emails sent per provider call (Resend accepts at most 100 per batch)
+OUTBOX_BATCH_SIZE = min(int(os.getenv("OUTBOX_BATCH_SIZE", "50")), 100)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# Retry n waits OUTBOX_BACKOFF_BASE * 2^(n-1) seconds, capped at OUTBOX_BACKOFF_MAX
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+# Idle wake-up interval, so retries come due without a new enqueue
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+# How long a claimed batch is hidden from other workers before it is retried; keep it
+# above EMAIL_SEND_TIMEOUT so a slow send is never picked up by a second worker
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+_conn = None
+_lock = threading.Lock()
+_wake = None
+_worker = None
+_counters = {"sent": 0, "failed_attempts": 0, "dead": 0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(OUTBOX_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=FULL")
+        _conn.executescript(SCHEMA)
+    return _conn
+
+def enqueue(params):
+    """Persist one email for delivery and return its row id (blocking - run in a thread)"""
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO outbox (params, next_attempt_at, created_at) VALUES (?, ?, ?)",
+                (json.dumps(params), now, now)
+            )
+    return cur.lastrowid
+
+def claim_batch(limit=OUTBOX_BATCH_SIZE):
+    """Lease up to `limit` due emails (blocking - run in a thread)"""
+    now = time.time()
+    claimed = []
+    dead = []
+    with _lock:
+        conn = _connection()
+        with conn:
+            # Take the write lock before reading, so worker processes never claim the same rows
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """
+                SELECT id, params, attempts, status FROM outbox
+                WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?
+                """,
+                (now, limit)
+            ).fetchall()
+            for row_id, params, attempts, status in rows:
+                # A 'sending' row whose lease ran out hung or crashed its worker mid-send,
+                # which counts as a failed attempt so it can't be retried forever
+                if status == "sending":
+                    attempts += 1
+                    if attempts >= OUTBOX_MAX_ATTEMPTS:
+                        dead.append((attempts, row_id))
+                        continue
+                claimed.append((row_id, params, attempts))
+            conn.executemany(
+                "UPDATE outbox SET status = 'dead', attempts = ?, last_error = 'lease expired' WHERE id = ?",
+                dead
+            )
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', attempts = ?, next_attempt_at = ? WHERE id = ?",
+                [(attempts, now + OUTBOX_LEASE_SECONDS, row_id) for row_id, _, attempts in claimed]
+            )
+    _counters["dead"] += len(dead)
+    return [(row_id, json.loads(params), attempts) for row_id, params, attempts in claimed]
+
+def mark_sent(ids):
+    """Drop delivered emails from the outbox (blocking - run in a thread)"""
+    with _lock:
+        conn = _connection()
+        with conn:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+def backoff_delay(attempts):
+    return min(OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX)
+
+def mark_failed(failures):
+    """Schedule a retry for each (email, error), or park it as dead once attempts run out (blocking)"""
+    now = time.time()
+    dead = 0
+    with _lock:
+        conn = _connection()
+        with conn:
+            for (row_id, _, attempts), error in failures:
+                attempts += 1
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    dead += 1
+                    conn.execute(
+                        "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts, error, row_id)
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, now + backoff_delay(attempts), error, row_id)
+                    )
+    return dead
+
+def queue_stats():
+    """Queue depth and age of the oldest undelivered email (blocking - run in a thread)"""
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        due, oldest = conn.execute(
+            "SELECT SUM(next_attempt_at <= ?), MIN(created_at) FROM outbox WHERE status != 'dead'",
+            (now,)
+        ).fetchone()
+    return {
+        "pending": counts.get("pending", 0) + counts.get("sending", 0),
+        "due": due or 0,
+        "dead": counts.get("dead", 0),
+        "oldest_pending_age": round(now - oldest, 1) if oldest else 0,
+        **_counters,
+    }
+
+async def enqueue_email(params):
+    """Queue an email and nudge the worker; returns as soon as it is on disk"""
+    row_id = await asyncio.to_thread(enqueue, params)
+    if _wake is not None:
+        _wake.set()
+    return row_id
+
+async def deliver_due():
+    """Send one batch of due emails; returns how many were claimed"""
+    lease_ends = time.time() + OUTBOX_LEASE_SECONDS
+    batch = await asyncio.to_thread(claim_batch)
+    if not batch:
+        return 0
+    sent = []
+    failures = []
+    try:
+        await asyncio.to_thread(send_email_batch, [params for _, params, _ in batch])
+        sent = [row_id for row_id, _, _ in batch]
+    except Exception as e:
+        batch_error = str(e)[:500]
+        if len(batch) == 1:
+            failures = [(batch[0], batch_error)]
+        else:
+            # A batch fails as a whole, so send one at a time to let only the bad emails retry
+            for email in batch:
+                # Past the lease another worker may claim the email, so leave the rest for a retry
+                if time.time() + EMAIL_SEND_TIMEOUT >= lease_ends:
+                    failures.append((email, batch_error))
+                    continue
+                try:
+                    await asyncio.to_thread(send_email, email[1])
+                    sent.append(email[0])
+                except Exception as e:
+                    failures.append((email, str(e)[:500]))
+
+    if sent:
+        await asyncio.to_thread(mark_sent, sent)
+        _counters["sent"] += len(sent)
+    if failures:
+        _counters["failed_attempts"] += len(failures)
+        _counters["dead"] += await asyncio.to_thread(mark_failed, failures)
+    return len(batch)
+
+async def run_worker():
+    while True:
+        try:
+            # Keep draining while full batches come back, then wait for a nudge or the poll interval
+            if await deliver_due() >= OUTBOX_BATCH_SIZE:
+                continue
+        except Exception as e:
+            print(f"Outbox worker error: {e}")
+        try:
+            await asyncio.wait_for(_wake.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+def start_worker():
+    global _wake, _worker
+    if _worker is None:
+        _wake = asyncio.Event()
+        _worker = asyncio.create_task(run_worker())
+
+async def stop_worker():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
@@ -0,0 +1,114 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# On-disk spatial index of every vetted place; set PLACE_INDEX_PATH="" to disable
+PLACE_INDEX_PATH = os.getenv("PLACE_INDEX_PATH", "place_index.db")
+# How long a searched (category, geocell) counts as covered by the index
+PLACE_INDEX_MAX_AGE = int(os.getenv("PLACE_INDEX_MAX_AGE", str(24 * 3600)))
+# Radius served from the index around the caller (matches the widest search tier)
+PLACE_INDEX_RADIUS_KM = float(os.getenv("PLACE_INDEX_RADIUS_KM", "15"))
+# Nearest indexed places read per lookup; the caller ranks these and keeps its top k
+PLACE_INDEX_CANDIDATES = int(os.getenv("PLACE_INDEX_CANDIDATES", "50"))
+
+_conn = None
+_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    id INTEGER PRIMARY KEY,
+    place_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    UNIQUE (place_id, category)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+CREATE TABLE IF NOT EXISTS coverage (
+    category TEXT NOT NULL,
+    cell TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (category, cell)
+);
+"""
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(PLACE_INDEX_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(SCHEMA)
+    return _conn
+
+def index_enabled():
+    return bool(PLACE_INDEX_PATH)
+
+def write_places(category, cell, places):
+    """Store vetted places for a category and mark the cell as covered (blocking - run in a thread)"""
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        with conn:
+            for p in places:
+                row = conn.execute(
+                    "SELECT id FROM places WHERE place_id = ? AND category = ?",
+                    (p["place_id"], category)
+                ).fetchone()
+                data = json.dumps(p)
+                if row:
+                    conn.execute("UPDATE places SET data = ?, fetched_at = ? WHERE id = ?", (data, now, row[0]))
+                    conn.execute(
+                        "UPDATE places_rtree SET min_lat = ?, max_lat = ?, min_lng = ?, max_lng = ? WHERE id = ?",
+                        (p["lat"], p["lat"], p["lng"], p["lng"], row[0])
+                    )
+                else:
+                    cur = conn.execute(
+                        "INSERT INTO places (place_id, category, data, fetched_at) VALUES (?, ?, ?, ?)",
+                        (p["place_id"], category, data, now)
+                    )
+                    conn.execute(
+                        "INSERT INTO places_rtree VALUES (?, ?, ?, ?, ?)",
+                        (cur.lastrowid, p["lat"], p["lat"], p["lng"], p["lng"])
+                    )
+            conn.execute(
+                "INSERT OR REPLACE INTO coverage (category, cell, fetched_at) VALUES (?, ?, ?)",
+                (category, cell, now)
+            )
+
+def query_places(category, cell, lat, lon, limit=PLACE_INDEX_CANDIDATES, radius_km=PLACE_INDEX_RADIUS_KM):
+    """The nearest places to the caller if the cell has fresh coverage, else None (blocking - run in a thread)"""
+    cutoff = time.time() - PLACE_INDEX_MAX_AGE
+    with _lock:
+        conn = _connection()
+        covered = conn.execute(
+            "SELECT 1 FROM coverage WHERE category = ? AND cell = ? AND fetched_at >= ?",
+            (category, cell, cutoff)
+        ).fetchone()
+        if not covered:
+            return None
+
+        # Bounding box around the caller, nearest first by equirectangular distance so
+        # only `limit` rows are decoded; rank_places sorts by true distance afterwards
+        scale = max(math.cos(math.radians(lat)), 0.01)
+        d_lat = radius_km / 111.0
+        d_lng = radius_km / (111.0 * scale)
+        rows = conn.execute(
+            """
+            SELECT p.data FROM places_rtree r JOIN places p ON p.id = r.id
+            WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lng >= ? AND r.max_lng <= ?
+              AND p.category = ? AND p.fetched_at >= ?
+            ORDER BY (r.min_lat - ?) * (r.min_lat - ?) + (r.min_lng - ?) * (r.min_lng - ?) * ?
+            LIMIT ?
+            """,
+            (lat - d_lat, lat + d_lat, lon - d_lng, lon + d_lng, category, cutoff,
+             lat, lat, lon, lon, scale * scale, limit)
+        ).fetchall()
+
+    return [json.loads(row[0]) for row in rows]
@@ -1,6 +1,25 @@
-import os, math, asyncio
-import httpx
+import os, time, asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from services.admission import degraded
+from services.cache import (
+    get_cached_places, set_cached_places,
+    get_cached_details, set_cached_details, DETAILS_FIELD_GROUPS, DETAILS_OPEN_NOW_TTL,
+    get_radius_hint, set_radius_hint
+)
+from services.geocell import geohash
+from services.geometry import KM_TO_MILES, distances_km, rank_order
+from services.matcher import TermMatcher
+from services.metrics import record_cache, span
+from services.place_index import index_enabled, query_places, write_places
+from services.singleflight import coalesce
+from services.scheduler import PRIORITY_BACKGROUND, upstream_priority
+from services.resilience import (
+    guarded_call, remaining_budget, upstream_budget, UpstreamStatusError, UPSTREAM_ERROR_STATUSES
+)
+from services.upstream import get_client, MAPS_BASE_URL
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -8,6 +27,33 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 # Optimized: Start with smaller radius, only expand if needed
 RADIUS_TIERS = [5000, 15000]
 
+# "sequential" always starts at the first tier; "adaptive" starts at the tier an
+# area needed last time and searches the next tier speculatively for unknown areas
+RADIUS_MODE = os.getenv("RADIUS_MODE", "adaptive")
+RADIUS_HINT_PRECISION = int(os.getenv("RADIUS_HINT_PRECISION", "5"))
+
+# Only the best k candidates get a Place Details call
+PLACES_TOP_K = int(os.getenv("PLACES_TOP_K", "10"))
+
+# Categories where a strong name match outranks a closer generic result
+PRIORITY_CATEGORIES = ["FOOD", "SHELTER", "LEGAL", "MENTAL_HEALTH"]
+
+WEEK_MINUTES = 7 * 1440
+
+# Stale-while-revalidate: background refreshes running at once, and the most
+# that may be pending before further refreshes are skipped
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "4"))
+REFRESH_MAX_PENDING = int(os.getenv("REFRESH_MAX_PENDING", "100"))
+
+# Fields kept on stored places so open_now can be worked out when they are served
+STORED_ONLY_FIELDS = ("hours", "utc_offset", "open_now_at")
+
+_refresh_slots = asyncio.Semaphore(REFRESH_CONCURRENCY)
+# Endpoints whose calls failed during the current search, see track_failures
+_failed_calls = ContextVar("failed_calls", default=None)
+_refreshing = set()
+_refresh_tasks = set()
+
 # Optimized: Reduced keywords to most effective ones
 CATEGORY_CONFIG = {
     "FOOD": {
@@ -78,200 +124,600 @@ CATEGORY_EXCEPTIONS = {
     "LEGAL": ["attorney", "lawyer", "law", "legal"]
 }
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371
-    d_lat = math.radians(lat2-lat1)
-    d_lon = math.radians(lon2-lon1)
-    a = math.sin(d_lat/2)**2 + math.cos(math.radians(lat1))*math.cos(math.radians(lat2))*math.sin(d_lon/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+# Name terms checked by is_relevant_result: a place must contain an "include"
+# term (when given) and must not contain an "exclude" term
+RELEVANCE_TERMS = {
+    "FOOD": {
+        "include": ["food bank", "pantry", "soup kitchen", "food rescue",
+                    "salvation army", "church", "mission", "community", "free food",
+                    "meals", "feeding", "hunger"]
+    },
+    "MEDICAL": {
+        "exclude": ["attorney", "lawyer", "law offices", "legal", "injury law"]
+    },
+    "SHELTER": {
+        "include": ["shelter", "housing", "homeless", "mission", "refuge", "safe house", "haven"]
+    },
+    "LEGAL": {
+        "include": ["legal aid", "legal services", "pro bono", "legal clinic",
+                    "public defender", "legal assistance", "community legal"],
+        "exclude": ["injury", "accident", "personal injury", "law firm", "attorneys at law"]
+    },
+    "MENTAL_HEALTH": {
+        "include": ["mental health", "counseling", "therapy", "psychiatric", "behavioral",
+                    "crisis", "support", "rehab", "treatment", "wellness"]
+    },
+    "TRANSPORTATION": {
+        "include": ["station", "terminal", "stop", "depot", "transit"]
+    },
+    "EMERGENCY": {
+        "include": ["emergency", "hospital", "police", "fire", "911", "crisis", "urgent care"]
+    }
+}
 
-async def fetch_json(client, url):
-    try:
+# Matchers are compiled once at import so filtering is a single pass per name
+BAD_MATCHER = TermMatcher(BAD_KEYWORDS)
+EXCEPTION_TERMS = {category: set(terms) for category, terms in CATEGORY_EXCEPTIONS.items()}
+REQUIRED_MATCHERS = {
+    category: TermMatcher(config["required_terms"])
+    for category, config in CATEGORY_CONFIG.items() if config["required_terms"]
+}
+RELEVANCE_MATCHERS = {
+    category: {kind: TermMatcher(terms) for kind, terms in rules.items()}
+    for category, rules in RELEVANCE_TERMS.items()
+}
+PRIORITY_MATCHERS = {
+    category: TermMatcher(CATEGORY_CONFIG[category]["required_terms"][:3])
+    for category in PRIORITY_CATEGORIES
+}
+
+async def fetch_json(client, url, endpoint):
+    """GET a Places endpoint; any failure, open circuit or exhausted budget yields an empty result"""
+    async def request():
         r = await client.get(url)
         r.raise_for_status()
-        return r.json()
-    except:
+        data = r.json()
+        if data.get("status") in UPSTREAM_ERROR_STATUSES:
+            raise UpstreamStatusError(data["status"])
+        return data
+
+    try:
+        return await guarded_call(endpoint, request)
+    except Exception:
+        record_failures([endpoint])
         return {}
 
+def record_failures(endpoints):
+    """Add failed endpoints to the enclosing track_failures block, if there is one"""
+    failed = _failed_calls.get()
+    if failed is not None:
+        failed.extend(endpoints)
+
+@contextmanager
+def track_failures():
+    """Collect the endpoints of Places calls that fail inside the block"""
+    failed = []
+    token = _failed_calls.set(failed)
+    try:
+        yield failed
+    finally:
+        _failed_calls.reset(token)
+
+def compute_open_now(opening_hours, utc_offset_minutes, now=None):
+    """Work out open_now locally from cached weekly periods, or None if that isn't possible"""
+    periods = opening_hours.get("periods")
+    if not periods or utc_offset_minutes is None:
+        return None
+
+    # Minutes since Sunday 00:00 in the place's local time (Google numbers days from Sunday)
+    local = (now or datetime.now(timezone.utc)) + timedelta(minutes=utc_offset_minutes)
+    week_minute = ((local.weekday() + 1) % 7) * 1440 + local.hour * 60 + local.minute
+
+    def to_minute(point):
+        return point["day"] * 1440 + int(point["time"][:2]) * 60 + int(point["time"][2:])
+
+    for period in periods:
+        # A period without a close time means open around the clock
+        if "close" not in period:
+            return True
+
+        start = to_minute(period["open"])
+        end = to_minute(period["close"])
+        if end <= start:
+            end += WEEK_MINUTES
+
+        if start <= week_minute < end or start <= week_minute + WEEK_MINUTES < end:
+            return True
+
+    return False
+
+def current_open_now(place, now=None):
+    """open_now for a stored place as of now: from its weekly periods, else a recent snapshot"""
+    if place.get("hours"):
+        open_now = compute_open_now({"periods": place["hours"]}, place.get("utc_offset"), now)
+        if open_now is not None:
+            return open_now
+
+    # Places without weekly periods only have Google's own open_now, which goes stale quickly
+    checked = place.get("open_now_at")
+    if checked is None or time.time() - checked > DETAILS_OPEN_NOW_TTL:
+        return None
+    return place.get("open_now")
+
 async def fetch_details_batch(client, place_ids):
-    """Fetch details for multiple places in parallel"""
+    """Fetch details for multiple places in parallel, only requesting fields whose cache entry has expired"""
+    details_map = {}
+    pending = []
     tasks = []
     for pid in place_ids:
+        fields, stale_groups = get_cached_details(pid)
+        details_map[pid] = fields
+        if not stale_groups:
+            continue
+
+        requested = ",".join(f for group in stale_groups for f in DETAILS_FIELD_GROUPS[group])
         url = (
-            f"https://maps.googleapis.com/maps/api/place/details/json?"
-            f"place_id={pid}&fields=formatted_phone_number,rating,user_ratings_total,opening_hours,geometry&key={GOOGLE_API_KEY}"
+            f"{MAPS_BASE_URL}/maps/api/place/details/json?"
+            f"place_id={pid}&fields={requested}&key={GOOGLE_API_KEY}"
         )
-        tasks.append(fetch_json(client, url))
+        pending.append((pid, stale_groups))
+        tasks.append(fetch_json(client, url, "details"))
     
-    responses = await asyncio.gather(*tasks)
-    return {place_ids[i]: resp.get("result", {}) for i, resp in enumerate(responses)}
+    with span("details"):
+        responses = await asyncio.gather(*tasks)
+    for (pid, stale_groups), resp in zip(pending, responses):
+        result = resp.get("result")
+        # On failure keep serving whatever was cached, even if stale
+        if result is None:
+            continue
+        set_cached_details(pid, stale_groups, result)
+        details_map[pid] = {**details_map[pid], **result}
+
+    # open_now goes stale within minutes, so derive it from the weekly periods when we can
+    for details in details_map.values():
+        hours = details.get("opening_hours")
+        if not hours:
+            continue
+        offset = details.get("utc_offset_minutes", details.get("utc_offset"))
+        open_now = compute_open_now(hours, offset)
+        if open_now is not None:
+            details["opening_hours"] = {**hours, "open_now": open_now}
+
+    return details_map
 
 async def text_search(client, query, lat, lon, radius):
-    base = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+    base = f"{MAPS_BASE_URL}/maps/api/place/textsearch/json"
     url = f"{base}?query={query}&location={lat},{lon}&radius={radius}&key={GOOGLE_API_KEY}"
-    return await fetch_json(client, url)
+    return await fetch_json(client, url, "textsearch")
 
 async def nearby_search(client, lat, lon, place_type, radius):
-    base = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+    base = f"{MAPS_BASE_URL}/maps/api/place/nearbysearch/json"
     url = f"{base}?location={lat},{lon}&radius={radius}&type={place_type}&key={GOOGLE_API_KEY}"
-    return await fetch_json(client, url)
+    return await fetch_json(client, url, "nearbysearch")
 
 def quick_filter(name, types, category, config):
     """Fast initial filter before detailed checks"""
-    name_lower = name.lower()
-    
     # Quick bad keyword check
-    exceptions = CATEGORY_EXCEPTIONS.get(category, [])
-    for bad in BAD_KEYWORDS:
-        if bad not in exceptions and bad in name_lower:
-            return False
+    bad = BAD_MATCHER.find(name) - EXCEPTION_TERMS.get(category, set())
+    if bad:
+        return False
     
     # Quick required term check
-    required_terms = config.get("required_terms", [])
-    if required_terms:
-        if not any(term in name_lower for term in required_terms):
-            return False
+    required = REQUIRED_MATCHERS.get(category)
+    if required and not required.search(name):
+        return False
     
     return True
 
 def is_relevant_result(place, category, config):
     """Detailed filtering for remaining candidates"""
-    name = place.get("name", "").lower()
-    types = place.get("types", [])
+    name = place.get("name", "")
+    matchers = RELEVANCE_MATCHERS.get(category)
+    if not matchers:
+        return True
     
-    if category == "FOOD":
-        good_indicators = ["food bank", "pantry", "soup kitchen", "food rescue", 
-                          "salvation army", "church", "mission", "community", "free food",
-                          "meals", "feeding", "hunger"]
-        bad_types = ["restaurant", "cafe", "bar", "meal_delivery", "meal_takeaway", 
-                    "bakery", "grocery_or_supermarket", "store"]
-        
-        if any(t in types for t in bad_types):
-            if not any(indicator in name for indicator in good_indicators):
-                return False
-        
-        return any(indicator in name for indicator in good_indicators)
+    # Private practices and similar look-alikes are rejected outright
+    exclude = matchers.get("exclude")
+    if exclude and exclude.search(name):
+        return False
     
-    elif category == "MEDICAL":
-        bad_medical = ["attorney", "lawyer", "law offices", "legal", "injury law"]
-        return not any(bad in name for bad in bad_medical)
+    include = matchers.get("include")
+    return include is None or include.search(name)
+
+def is_priority(name, category):
+    """True if the name carries one of the category's top terms, boosting it ahead of closer results"""
+    matcher = PRIORITY_MATCHERS.get(category)
+    return matcher is not None and matcher.search(name)
+
+def select_top_candidates(candidates, lat, lon, category, config, k):
+    """Pick the k best search hits by priority boost then preliminary distance"""
+    hits = list(candidates.values())
+    # Hits without search geometry are only used if nothing better exists
+    points = []
+    for p in hits:
+        loc = p.get("geometry", {}).get("location")
+        points.append((loc["lat"], loc["lng"]) if loc else None)
+
+    distances = distances_km(lat, lon, points)
+    boosted = [is_priority(p.get("name", ""), category) for p in hits]
+    return [hits[i] for i in rank_order(distances, boosted, k)]
+
+def nearest_places(places, lat, lon, category, k=PLACES_TOP_K):
+    """(indexes of the top k stored places for the caller, their distances in km), best first"""
+    distances = distances_km(lat, lon, [(p["lat"], p["lng"]) for p in places])
+
+    # Priority sorting for specific categories
+    boosted = None
+    if category in PRIORITY_MATCHERS:
+        boosted = [is_priority(p["name"], category) for p in places]
+    return rank_order(distances, boosted, k), distances
+
+def rank_places(places, lat, lon, category):
+    """Order stored places by distance to the caller, applying the category priority boost"""
+    order, distances = nearest_places(places, lat, lon, category)
+
+    # Cached and indexed places can be hours old, so open_now is worked out for right now
+    now = datetime.now(timezone.utc)
+    ranked = []
+    for i in order:
+        place = {k: v for k, v in places[i].items() if k not in STORED_ONLY_FIELDS}
+        place["open_now"] = current_open_now(places[i], now)
+        place["distance_miles"] = round(distances[i]*KM_TO_MILES, 2)
+        ranked.append(place)
+    return ranked
+
+async def search_tier(client, lat, lon, config, radius):
+    """Run every text and type search for one radius tier in parallel"""
+    tasks = []
     
-    elif category == "SHELTER":
-        shelter_terms = ["shelter", "housing", "homeless", "mission", "refuge", "safe house", "haven"]
-        return any(term in name for term in shelter_terms)
+    # Text searches (prioritized)
+    for keyword in config["keywords"]:
+        tasks.append(text_search(client, keyword, lat, lon, radius))
     
-    elif category == "LEGAL":
-        legal_aid_terms = ["legal aid", "legal services", "pro bono", "legal clinic", 
-                          "public defender", "legal assistance", "community legal"]
-        private_law = ["injury", "accident", "personal injury", "law firm", "attorneys at law"]
-        
-        if any(term in name for term in private_law):
-            return False
-        
-        return any(term in name for term in legal_aid_terms)
+    # Type searches (supplement)
+    for place_type in config["types"]:
+        tasks.append(nearby_search(client, lat, lon, place_type, radius))
     
-    elif category == "MENTAL_HEALTH":
-        mh_terms = ["mental health", "counseling", "therapy", "psychiatric", "behavioral", 
-                   "crisis", "support", "rehab", "treatment", "wellness"]
-        return any(term in name for term in mh_terms)
+    with span("search"):
+        return await asyncio.gather(*tasks)
+
+async def search_places(lat, lon, category):
+    """Run the tiered upstream search and return the top-k vetted places with their coordinates"""
+    config = CATEGORY_CONFIG.get(category, {"keywords": [], "types": [], "required_terms": []})
     
-    elif category == "TRANSPORTATION":
-        transit_terms = ["station", "terminal", "stop", "depot", "transit"]
-        return any(term in name for term in transit_terms)
+    # Shared keep-alive pool, reused across requests
+    client = get_client("places")
     
-    elif category == "EMERGENCY":
-        emergency_terms = ["emergency", "hospital", "police", "fire", "911", "crisis", "urgent care"]
-        return any(term in name for term in emergency_terms)
+    adaptive = RADIUS_MODE == "adaptive"
+    hint_cell = geohash(lat, lon, RADIUS_HINT_PRECISION)
+    hint = get_radius_hint(category, hint_cell) if adaptive else None
+    start = hint if hint is not None and hint < len(RADIUS_TIERS) else 0
     
-    return True
+    async def run_tier(i):
+        # Failures are kept per tier, so a speculative tier that is never used
+        # doesn't mark the result as incomplete
+        with track_failures() as failed:
+            responses = await search_tier(client, lat, lon, config, RADIUS_TIERS[i])
+        return responses, failed
 
-async def find_places(lat, lon, category):
-    results = {}
-    config = CATEGORY_CONFIG.get(category, {"keywords": [], "types": [], "required_terms": []})
+    tier_tasks = {}
+    def launch(i):
+        if i < len(RADIUS_TIERS) and i not in tier_tasks:
+            tier_tasks[i] = asyncio.ensure_future(run_tier(i))
     
-    # Use connection pooling for better performance
-    limits = httpx.Limits(max_keepalive_connections=10, max_connections=20)
-    async with httpx.AsyncClient(timeout=8.0, limits=limits) as client:
-        
-        for radius in RADIUS_TIERS:
-            # Build all search tasks
-            tasks = []
-            
-            # Text searches (prioritized)
-            for keyword in config["keywords"]:
-                tasks.append(text_search(client, keyword, lat, lon, radius))
-            
-            # Type searches (supplement)
-            for place_type in config["types"]:
-                tasks.append(nearby_search(client, lat, lon, place_type, radius))
+    candidates = {}
+    used = start
+    try:
+        for i in range(start, len(RADIUS_TIERS)):
+            launch(i)
+            # With no history for this area, start the wider tier speculatively
+            if adaptive and hint is None:
+                launch(i + 1)
             
-            # Execute all searches in parallel
-            responses = await asyncio.gather(*tasks)
+            responses, failed = await tier_tasks[i]
+            record_failures(failed)
+            used = i
             
-            # Quick filtering pass
-            candidates = {}
             for data in responses:
                 for p in data.get("results", []):
                     pid = p["place_id"]
-                    if pid in results or pid in candidates:
+                    if pid in candidates:
                         continue
                     
-                    # Fast initial filter
-                    if quick_filter(p.get("name", ""), p.get("types", []), category, config):
-                        candidates[pid] = p
-            
-            # Detailed filtering
-            filtered_candidates = {}
-            for pid, p in candidates.items():
-                if is_relevant_result(p, category, config):
-                    filtered_candidates[pid] = p
-            
-            # Batch fetch details for filtered candidates
-            if filtered_candidates:
-                place_ids = list(filtered_candidates.keys())
-                details_map = await fetch_details_batch(client, place_ids)
-                
-                for pid, p in filtered_candidates.items():
-                    details = details_map.get(pid, {})
-                    loc = details.get("geometry", {}).get("location", p.get("geometry", {}).get("location", {}))
-                    
-                    if not loc:
+                    # Fast initial filter, then detailed filtering
+                    if not quick_filter(p.get("name", ""), p.get("types", []), category, config):
                         continue
-                    
-                    dist = haversine(lat, lon, loc.get("lat", lat), loc.get("lng", lon))
-                    dist_miles = dist*0.621371
-                    
-                    results[pid] = {
-                        "name": p.get("name"),
-                        "address": p.get("formatted_address", p.get("vicinity")),
-                        "distance_miles": round(dist_miles, 2),
-                        "rating": details.get("rating"),
-                        "reviews": details.get("user_ratings_total"),
-                        "phone": details.get("formatted_phone_number"),
-                        "open_now": details.get("opening_hours", {}).get("open_now") if details.get("opening_hours") else None,
-                        "maps_url": f"https://www.google.com/maps/dir/?api=1&destination={loc.get('lat')},{loc.get('lng')}&destination_place_id={pid}"
-                    }
+                    if is_relevant_result(p, category, config):
+                        candidates[pid] = p
             
-            # Early exit if we have enough results
-            if len(results) >= 10:
+            # Early exit if this tier already yields enough candidates
+            if len(candidates) >= PLACES_TOP_K:
                 break
+    finally:
+        # A speculative tier we no longer need is cancelled mid-flight
+        for task in tier_tasks.values():
+            if not task.done():
+                task.cancel()
+    
+    # Remember how wide this area needs to search so the next request starts there
+    if adaptive:
+        set_radius_hint(category, hint_cell, used)
+    
+    # Details are only worth fetching for places that can make the final list
+    top = select_top_candidates(candidates, lat, lon, category, config, PLACES_TOP_K)
+    if not top:
+        return []
+    
+    details_map = await fetch_details_batch(client, [p["place_id"] for p in top])
+    return build_results(top, details_map, lat, lon)
+
+def build_results(top, details_map, lat, lon):
+    """Merge search hits with their details into the stored place records"""
+    results = []
+    for p in top:
+        pid = p["place_id"]
+        details = details_map.get(pid, {})
+        loc = details.get("geometry", {}).get("location", p.get("geometry", {}).get("location", {}))
         
-        # Sort by distance
-        sorted_results = sorted(results.values(), key=lambda x: x["distance_miles"])
-        
-        # Priority sorting for specific categories
-        if category in ["FOOD", "SHELTER", "LEGAL", "MENTAL_HEALTH"]:
-            priority_terms = config.get("required_terms", [])[:3]
-            priority = []
-            regular = []
-            
-            for place in sorted_results:
-                name_lower = place["name"].lower()
-                if any(term in name_lower for term in priority_terms):
-                    priority.append(place)
-                else:
-                    regular.append(place)
-            
-            sorted_results = priority + regular
+        if not loc:
+            continue
         
-        return sorted_results[:10]
\ No newline at end of file
+        hours = details.get("opening_hours") or {}
+        # Coordinates are kept so cached results can be re-ranked for other callers, and
+        # the weekly periods so open_now can be worked out whenever they are served
+        results.append({
+            "place_id": pid,
+            "lat": loc.get("lat", lat),
+            "lng": loc.get("lng", lon),
+            "name": p.get("name"),
+            "address": p.get("formatted_address", p.get("vicinity")),
+            "rating": details.get("rating"),
+            "reviews": details.get("user_ratings_total"),
+            "phone": details.get("formatted_phone_number"),
+            "open_now": hours.get("open_now"),
+            "open_now_at": time.time() if hours else None,
+            "hours": hours.get("periods"),
+            "utc_offset": details.get("utc_offset_minutes", details.get("utc_offset")),
+            "maps_url": f"https://www.google.com/maps/dir/?api=1&destination={loc.get('lat')},{loc.get('lng')}&destination_place_id={pid}"
+        })
+    
+    return results
+
+async def search_places_batch(lat, lon, categories):
+    """Search several categories with one deduplicated set of upstream calls; returns {category: places}
+
+    Each category is vetted only against the searches its own plan calls for, so
+    its results match a search_places call on its own. Searches and details
+    shared by several categories are requested once.
+    """
+    client = get_client("places")
+    configs = {c: CATEGORY_CONFIG.get(c, {"keywords": [], "types": [], "required_terms": []}) for c in categories}
+
+    adaptive = RADIUS_MODE == "adaptive"
+    hint_cell = geohash(lat, lon, RADIUS_HINT_PRECISION)
+    next_tier = {}
+    for category in categories:
+        hint = get_radius_hint(category, hint_cell) if adaptive else None
+        next_tier[category] = hint if hint is not None and hint < len(RADIUS_TIERS) else 0
+    used = dict(next_tier)
+
+    searched = {}
+    candidates = {c: {} for c in categories}
+    active = list(categories)
+    while active:
+        # Each round widens only the categories still short of results
+        planned = {}
+        for category in active:
+            radius = RADIUS_TIERS[next_tier[category]]
+            config = configs[category]
+            planned[category] = (
+                [("text", keyword, radius) for keyword in config["keywords"]]
+                + [("type", place_type, radius) for place_type in config["types"]]
+            )
+            used[category] = next_tier[category]
+            next_tier[category] += 1
+
+        new = [
+            key for key in dict.fromkeys(key for keys in planned.values() for key in keys)
+            if key not in searched
+        ]
+        calls = [
+            text_search(client, term, lat, lon, radius) if kind == "text"
+            else nearby_search(client, lat, lon, term, radius)
+            for kind, term, radius in new
+        ]
+        with span("search"):
+            responses = await asyncio.gather(*calls)
+        searched.update(zip(new, responses))
+
+        for category in active:
+            config = configs[category]
+            found = candidates[category]
+            for key in planned[category]:
+                for p in searched[key].get("results", []):
+                    pid = p["place_id"]
+                    if pid in found:
+                        continue
+                    if not quick_filter(p.get("name", ""), p.get("types", []), category, config):
+                        continue
+                    if is_relevant_result(p, category, config):
+                        found[pid] = p
+
+        active = [
+            c for c in active
+            if len(candidates[c]) < PLACES_TOP_K and next_tier[c] < len(RADIUS_TIERS)
+        ]
+
+    if adaptive:
+        for category in categories:
+            set_radius_hint(category, hint_cell, used[category])
+
+    tops = {
+        c: select_top_candidates(candidates[c], lat, lon, c, configs[c], PLACES_TOP_K)
+        for c in categories
+    }
+    # One details fetch covers every place that made any category's list
+    place_ids = list(dict.fromkeys(p["place_id"] for top in tops.values() for p in top))
+    details_map = await fetch_details_batch(client, place_ids) if place_ids else {}
+
+    return {c: build_results(top, details_map, lat, lon) for c, top in tops.items()}
+
+async def read_index(lat, lon, category, cell):
+    """Places for a cell from the local place index, or None if it isn't covered"""
+    if not index_enabled():
+        return None
+    try:
+        places = await asyncio.to_thread(query_places, category, cell, lat, lon)
+    except Exception as e:
+        print(f"Place index read error: {e}")
+        places = None
+    record_cache("place_index", "hit" if places else "miss")
+    if not places:
+        return None
+    # Only the top k are kept, the same size as an upstream result for the cell
+    order, _ = nearest_places(places, lat, lon, category)
+    return [places[i] for i in order]
+
+async def read_cached_places(lat, lon, category, cell):
+    """Degraded-mode fill for a cache miss: the local place index or nothing, never upstream"""
+    places = await read_index(lat, lon, category, cell)
+    if places:
+        set_cached_places(category, cell, places)
+    return places or []
+
+async def store_places(category, cell, places, complete=True):
+    """Cache a fresh upstream result and persist it to the place index"""
+    # Don't pin an upstream failure or a partial result (a failed or circuit-broken call,
+    # or a budget-truncated search) in the cache, and never mark the cell as covered by it
+    budget = remaining_budget()
+    if not places or not complete or (budget is not None and budget <= 0):
+        return
+    set_cached_places(category, cell, places)
+    if index_enabled():
+        try:
+            await asyncio.to_thread(write_places, category, cell, places)
+        except Exception as e:
+            print(f"Place index write error: {e}")
+
+async def load_places(lat, lon, category, cell):
+    """Fill a cache miss from the local place index, or from upstream if the cell isn't covered"""
+    places = await read_index(lat, lon, category, cell)
+    if places:
+        set_cached_places(category, cell, places)
+        return places
+
+    with track_failures() as failed:
+        places = await search_places(lat, lon, category)
+    await store_places(category, cell, places, complete=not failed)
+    return places
+
+async def load_places_batch(lat, lon, categories, cell):
+    """Fill cache misses for several categories, sharing one upstream fan-out for those the index lacks"""
+    indexed = await asyncio.gather(*(read_index(lat, lon, c, cell) for c in categories))
+    results = {}
+    missing = []
+    for category, places in zip(categories, indexed):
+        if places:
+            set_cached_places(category, cell, places)
+            results[category] = places
+        else:
+            missing.append(category)
+
+    if missing:
+        # A failed call may have belonged to any category's plan, so none of them is stored
+        with track_failures() as failed:
+            searched = await search_places_batch(lat, lon, missing)
+        for category in missing:
+            await store_places(category, cell, searched[category], complete=not failed)
+        results.update(searched)
+    return results
+
+async def revalidate_places(lat, lon, category, cell):
+    """Fresh upstream results for a cell; the index is skipped since it holds the same stale data"""
+    with track_failures() as failed:
+        places = await search_places(lat, lon, category)
+    await store_places(category, cell, places, complete=not failed)
+    return places
+
+async def refresh_places(lat, lon, category, cell):
+    """Background revalidation of a stale cache entry"""
+    try:
+        async with _refresh_slots:
+            # The refresh outlives the request that triggered it, so it gets its own budget,
+            # and it yields to live traffic when upstream slots run short
+            with upstream_budget(), upstream_priority(PRIORITY_BACKGROUND):
+                await coalesce(
+                    ("places", category, cell),
+                    lambda: revalidate_places(lat, lon, category, cell)
+                )
+    except Exception as e:
+        print(f"Background refresh failed for {category} {cell}: {e}")
+    finally:
+        _refreshing.discard((category, cell))
+
+def schedule_refresh(lat, lon, category, cell):
+    key = (category, cell)
+    # One refresh per entry, and shed refreshes rather than queueing without bound
+    if key in _refreshing or len(_refreshing) >= REFRESH_MAX_PENDING:
+        return
+    _refreshing.add(key)
+    task = asyncio.create_task(refresh_places(lat, lon, category, cell))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+async def find_places(lat, lon, category):
+    with span("places"):
+        # Nearby callers share a geocell, so one upstream search serves the whole cell
+        cell = geohash(lat, lon)
+        places, fresh = get_cached_places(category, cell)
+        if places is not None and not fresh:
+            # Serve the slightly stale entry now and revalidate it in the background
+            if not degraded():
+                schedule_refresh(lat, lon, category, cell)
+        elif places is None and degraded():
+            # Shedding load: answer from what is stored locally rather than calling Google
+            places = await read_cached_places(lat, lon, category, cell)
+        elif places is None:
+            # Concurrent misses for the same cell share one upstream fan-out
+            places = await coalesce(
+                ("places", category, cell),
+                lambda: load_places(lat, lon, category, cell)
+            )
+
+        return rank_places(places, lat, lon, category)
+
+async def find_places_batch(lat, lon, categories):
+    """find_places for several categories at one location, returning {category: ranked places}"""
+    with span("places"):
+        cell = geohash(lat, lon)
+        results = {}
+        missing = []
+        for category in dict.fromkeys(categories):
+            places, fresh = get_cached_places(category, cell)
+            if places is None:
+                missing.append(category)
+                continue
+            if not fresh and not degraded():
+                schedule_refresh(lat, lon, category, cell)
+            results[category] = places
+
+        if missing and degraded():
+            # Shedding load: answer from what is stored locally rather than calling Google
+            loaded = await asyncio.gather(*(read_cached_places(lat, lon, c, cell) for c in missing))
+            results.update(zip(missing, loaded))
+        elif len(missing) == 1:
+            # A lone miss takes the single-category path and joins any identical in-flight lookup
+            category = missing[0]
+            results[category] = await coalesce(
+                ("places", category, cell),
+                lambda: load_places(lat, lon, category, cell)
+            )
+        elif missing:
+            # Identical batches from the same cell (e.g. a home screen reload) share one fan-out
+            loaded = await coalesce(
+                ("places_batch", cell, tuple(sorted(missing))),
+                lambda: load_places_batch(lat, lon, missing, cell)
+            )
+            results.update(loaded)
+
+        return {c: rank_places(results[c], lat, lon, c) for c in dict.fromkeys(categories)}
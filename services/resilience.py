@@ -0,0 +1,182 @@
+import os
+import time
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from services.metrics import inc, record_upstream
+from services.scheduler import endpoint_saturated, upstream_slot
+
+load_dotenv()
+
+# Total time a request may spend waiting on upstreams before partial results are returned
+UPSTREAM_BUDGET = float(os.getenv("UPSTREAM_BUDGET", "5.0"))
+
+# Circuit breaker: open after this many consecutive failures, retry after the cool-down
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+# A call cut off by the budget after running this long counts as a failure (brown-out)
+CIRCUIT_SLOW_CALL = float(os.getenv("CIRCUIT_SLOW_CALL", "2.0"))
+
+# Hedging: duplicate a call still running after the endpoint's recent p95
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "true").lower() == "true"
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.2"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# Google reports some failures inside a 200 response
+UPSTREAM_ERROR_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+class CircuitOpenError(Exception):
+    pass
+
+class UpstreamStatusError(Exception):
+    pass
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+_circuits = {}
+_latencies = {}
+
+@contextmanager
+def upstream_budget(seconds=UPSTREAM_BUDGET):
+    """Bound the total upstream wait for everything started inside this block"""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_budget():
+    """Seconds left in the current budget, or None when no budget is active"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def _circuit(endpoint):
+    return _circuits.setdefault(endpoint, {"failures": 0, "opened_at": None, "trial": False})
+
+def circuit_allows(endpoint):
+    circuit = _circuit(endpoint)
+    if circuit["opened_at"] is None:
+        return True
+    # Half-open: let a single trial call through once the cool-down has passed
+    if time.monotonic() - circuit["opened_at"] >= CIRCUIT_RESET_SECONDS and not circuit["trial"]:
+        circuit["trial"] = True
+        return True
+    return False
+
+def record_success(endpoint, latency):
+    circuit = _circuit(endpoint)
+    circuit["failures"] = 0
+    circuit["opened_at"] = None
+    circuit["trial"] = False
+    _latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(latency)
+
+def record_failure(endpoint):
+    circuit = _circuit(endpoint)
+    circuit["failures"] += 1
+    if circuit["trial"] or circuit["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+        circuit["opened_at"] = time.monotonic()
+    circuit["trial"] = False
+
+def hedge_delay(endpoint):
+    """The endpoint's recent p95 latency, or None while there are too few samples"""
+    samples = _latencies.get(endpoint)
+    if not HEDGING_ENABLED or not samples or len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return max(ordered[int(len(ordered) * 0.95) - 1], HEDGE_MIN_DELAY)
+
+async def _hedged(endpoint, make_call):
+    attempts = [asyncio.ensure_future(make_call())]
+    try:
+        delay = hedge_delay(endpoint)
+        if delay is None:
+            return await attempts[0]
+
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done and not endpoint_saturated(endpoint):
+            # The first attempt is slower than usual - race a duplicate against it,
+            # unless the duplicate would only queue behind other calls for a slot
+            attempts.append(asyncio.ensure_future(make_call()))
+
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+
+        # Every attempt failed
+        return attempts[0].result()
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # A losing attempt may have failed; mark its exception as seen
+                task.exception()
+
+async def guarded_call(endpoint, make_call):
+    """Run an upstream call under the request budget, the endpoint's circuit breaker and hedging"""
+    if not circuit_allows(endpoint):
+        inc("upstream_requests_total", endpoint=endpoint, outcome="circuit_open")
+        raise CircuitOpenError(f"{endpoint} circuit is open")
+    # Calls only get through an open circuit as the half-open trial
+    is_trial = _circuit(endpoint)["opened_at"] is not None
+
+    budget = remaining_budget()
+    if budget is not None and budget <= 0:
+        inc("upstream_requests_total", endpoint=endpoint, outcome="budget_exhausted")
+        raise asyncio.TimeoutError(f"upstream budget exhausted before {endpoint} call")
+
+    # Every attempt, hedges included, waits for a scheduler slot; latency is measured
+    # from when the first attempt got one so queueing never trips the breaker
+    started = []
+
+    async def scheduled_call():
+        async with upstream_slot(endpoint):
+            started.append(time.monotonic())
+            return await make_call()
+
+    try:
+        result = await asyncio.wait_for(_hedged(endpoint, scheduled_call), budget)
+    except asyncio.TimeoutError:
+        ran_for = time.monotonic() - started[0] if started else 0.0
+        record_upstream(endpoint, ran_for, "timeout")
+        # Running out of budget only counts against the endpoint if the call was given real time
+        if ran_for >= CIRCUIT_SLOW_CALL:
+            record_failure(endpoint)
+        elif is_trial:
+            _circuit(endpoint)["trial"] = False
+        raise
+    except asyncio.CancelledError:
+        # An abandoned trial must not leave the circuit waiting on it forever
+        if is_trial:
+            _circuit(endpoint)["trial"] = False
+        raise
+    except Exception:
+        record_upstream(endpoint, time.monotonic() - started[0] if started else 0.0, "error")
+        record_failure(endpoint)
+        raise
+
+    latency = time.monotonic() - started[0]
+    record_upstream(endpoint, latency, "ok")
+    record_success(endpoint, latency)
+    return result
+
+def circuit_stats():
+    """Breaker state and recent p95 latency per endpoint"""
+    stats = {}
+    for endpoint, circuit in _circuits.items():
+        state = "closed"
+        if circuit["opened_at"] is not None:
+            state = "half_open" if circuit["trial"] else "open"
+        stats[endpoint] = {
+            "state": state,
+            "consecutive_failures": circuit["failures"],
+            "hedge_delay": hedge_delay(endpoint),
+        }
+    return stats
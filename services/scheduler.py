@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import bisect
+import contextvars
+import itertools
+from contextlib import asynccontextmanager, contextmanager
+from dotenv import load_dotenv
+from services.metrics import observe
+
+load_dotenv()
+
+# Priority classes, most urgent first. Waiting upstream calls are started in this
+# order whenever the global limit, not the endpoint's own limit, is what holds them back
+PRIORITY_URGENT = 0       # chat about EMERGENCY / SHELTER
+PRIORITY_CHAT = 1         # every other chat turn
+PRIORITY_DISCOVER = 2     # discover tiles
+PRIORITY_BACKGROUND = 3   # stale-entry refreshes and pre-warming
+
+PRIORITY_NAMES = {
+    PRIORITY_URGENT: "urgent",
+    PRIORITY_CHAT: "chat",
+    PRIORITY_DISCOVER: "discover",
+    PRIORITY_BACKGROUND: "background",
+}
+
+URGENT_CATEGORIES = set(os.getenv("UPSTREAM_URGENT_CATEGORIES", "EMERGENCY,SHELTER").split(","))
+
+# Upstream calls in flight across the whole process
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "64"))
+
+# Per-endpoint concurrency caps, and token-bucket QPS limits (0 = unlimited) with
+# a burst of UPSTREAM_QPS_BURST seconds' worth of tokens
+ENDPOINT_LIMITS = {
+    endpoint: {
+        "concurrency": int(os.getenv(f"UPSTREAM_CONCURRENCY_{endpoint.upper()}", str(concurrency))),
+        "qps": float(os.getenv(f"UPSTREAM_QPS_{endpoint.upper()}", "0")),
+    }
+    for endpoint, concurrency in (("textsearch", 32), ("nearbysearch", 16), ("details", 32), ("geocode", 16))
+}
+UPSTREAM_QPS_BURST = float(os.getenv("UPSTREAM_QPS_BURST", "1.0"))
+
+_priority = contextvars.ContextVar("upstream_priority", default=PRIORITY_CHAT)
+_sequence = itertools.count()
+_waiters = []
+_in_flight = {}
+_buckets = {}
+_state = {"total": 0, "timer": None}
+
+def _limits(endpoint):
+    return ENDPOINT_LIMITS.get(endpoint, {"concurrency": UPSTREAM_MAX_CONCURRENCY, "qps": 0.0})
+
+@contextmanager
+def upstream_priority(level):
+    """Run upstream calls started inside this block at the given priority class"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def chat_priority(categories):
+    return PRIORITY_URGENT if URGENT_CATEGORIES.intersection(categories) else PRIORITY_CHAT
+
+def _take_token(endpoint, now):
+    """Spend a token if one is available; otherwise return seconds until the next one"""
+    qps = _limits(endpoint)["qps"]
+    if qps <= 0:
+        return 0.0
+    capacity = max(qps * UPSTREAM_QPS_BURST, 1.0)
+    bucket = _buckets.setdefault(endpoint, {"tokens": capacity, "updated": now})
+    bucket["tokens"] = min(capacity, bucket["tokens"] + (now - bucket["updated"]) * qps)
+    bucket["updated"] = now
+    if bucket["tokens"] >= 1:
+        bucket["tokens"] -= 1
+        return 0.0
+    return (1 - bucket["tokens"]) / qps
+
+def _dispatch():
+    """Start every waiter that fits, most urgent first"""
+    if _state["timer"] is not None:
+        _state["timer"].cancel()
+        _state["timer"] = None
+    now = time.monotonic()
+    retry_in = None
+    remaining = []
+    for waiter in _waiters:
+        priority, _, endpoint, future = waiter
+        if future.done():
+            continue
+        if _state["total"] >= UPSTREAM_MAX_CONCURRENCY or _in_flight.get(endpoint, 0) >= _limits(endpoint)["concurrency"]:
+            remaining.append(waiter)
+            continue
+        wait = _take_token(endpoint, now)
+        if wait > 0:
+            retry_in = wait if retry_in is None else min(retry_in, wait)
+            remaining.append(waiter)
+            continue
+        _state["total"] += 1
+        _in_flight[endpoint] = _in_flight.get(endpoint, 0) + 1
+        future.set_result(None)
+    _waiters[:] = remaining
+
+    # Rate-limited waiters are retried once the next token is due
+    if retry_in is not None:
+        _state["timer"] = asyncio.get_running_loop().call_later(retry_in, _dispatch)
+
+def _release(endpoint):
+    _state["total"] -= 1
+    _in_flight[endpoint] -= 1
+    if _waiters:
+        _dispatch()
+
+@asynccontextmanager
+async def upstream_slot(endpoint):
+    """Hold one of the process-wide upstream slots for an endpoint while the block runs"""
+    priority = _priority.get()
+    future = asyncio.get_running_loop().create_future()
+    bisect.insort(_waiters, (priority, next(_sequence), endpoint, future))
+    queued_at = time.monotonic()
+    _dispatch()
+
+    try:
+        await future
+    except asyncio.CancelledError:
+        # Cancelled (e.g. by the request budget) after being granted: hand the slot back
+        if future.done() and not future.cancelled():
+            _release(endpoint)
+        raise
+    observe("upstream_queue_seconds", time.monotonic() - queued_at, priority=PRIORITY_NAMES.get(priority, str(priority)))
+
+    try:
+        yield
+    finally:
+        _release(endpoint)
+
+def endpoint_saturated(endpoint):
+    """True when new calls to an endpoint would have to queue"""
+    return (
+        _state["total"] >= UPSTREAM_MAX_CONCURRENCY
+        or _in_flight.get(endpoint, 0) >= _limits(endpoint)["concurrency"]
+        or any(waiter[2] == endpoint for waiter in _waiters)
+    )
+
+def scheduler_stats():
+    """In-flight calls per endpoint and queued calls per priority class"""
+    waiting = {name: 0 for name in PRIORITY_NAMES.values()}
+    for priority, _, _, future in _waiters:
+        if not future.done():
+            waiting[PRIORITY_NAMES.get(priority, str(priority))] += 1
+    return {
+        "in_flight": _state["total"],
+        "max_concurrency": UPSTREAM_MAX_CONCURRENCY,
+        "endpoints": {
+            endpoint: {
+                "in_flight": _in_flight.get(endpoint, 0),
+                "concurrency": _limits(endpoint)["concurrency"],
+                "qps": _limits(endpoint)["qps"] or None,
+            }
+            for endpoint in set(ENDPOINT_LIMITS) | set(_in_flight)
+        },
+        "waiting": waiting,
+    }
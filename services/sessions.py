@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import asyncio
+import secrets
+import sqlite3
+import threading
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from schemas import ChatMessage
+from services.geometry import haversine
+
+load_dotenv()
+
+# Sessions live in SQLite so every worker process sees them; set SESSION_STORE_PATH=""
+# to keep them in process memory instead (single worker only)
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db")
+# Sessions expire after this many idle seconds
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+# Oldest turns beyond this are dropped from the stored history
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "100"))
+# Moving further than this re-runs geocoding and the places lookup
+SESSION_MOVE_KM = float(os.getenv("SESSION_MOVE_KM", "1.0"))
+
+_sessions = TTLCache(maxsize=SESSION_MAX, ttl=SESSION_TTL)
+# Turns in one session are handled one at a time within a process
+_locks = TTLCache(maxsize=SESSION_MAX, ttl=SESSION_TTL)
+_conn = None
+_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+"""
+
+# Bookkeeping kept on the loaded dict but not stored
+_LOCAL_FIELDS = ("version", "stored_messages")
+
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(SESSION_STORE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(SCHEMA)
+    return _conn
+
+def _dump(session):
+    data = {k: v for k, v in session.items() if k not in _LOCAL_FIELDS}
+    # Oldest turns beyond the cap are dropped from the stored history
+    data["messages"] = [m.model_dump() for m in session["messages"][-SESSION_MAX_MESSAGES:]]
+    return json.dumps(data)
+
+def _load(row):
+    session = json.loads(row[0])
+    session["messages"] = [ChatMessage(**m) for m in session["messages"]]
+    session["version"] = row[1]
+    session["stored_messages"] = len(session["messages"])
+    return session
+
+def create_session(latitude, longitude, age_group):
+    """Start a session and return its id (blocking - run in a thread)"""
+    session_id = secrets.token_urlsafe(16)
+    session = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "age_group": age_group,
+        "messages": [],
+        "location_info": None,
+        "service_type": None,
+        "places": None,
+        # Places for additional needs in the latest turn, keyed by category
+        "related": {},
+        "places_at": None,
+    }
+    if not SESSION_STORE_PATH:
+        _sessions[session_id] = session
+        return session_id
+
+    now = time.time()
+    with _lock:
+        conn = _connection()
+        with conn:
+            # Expired sessions are swept as new ones arrive
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - SESSION_TTL,))
+            conn.execute(
+                "INSERT INTO sessions (id, data, version, updated_at) VALUES (?, ?, 0, ?)",
+                (session_id, _dump(session), now)
+            )
+    return session_id
+
+def get_session(session_id):
+    """The stored session, or None if it is unknown or expired (blocking - run in a thread)"""
+    if not SESSION_STORE_PATH:
+        return _sessions.get(session_id)
+
+    with _lock:
+        row = _connection().execute(
+            "SELECT data, version FROM sessions WHERE id = ? AND updated_at >= ?",
+            (session_id, time.time() - SESSION_TTL)
+        ).fetchone()
+    return _load(row) if row else None
+
+def session_lock(session_id):
+    lock = _locks.get(session_id)
+    if lock is None:
+        lock = _locks[session_id] = asyncio.Lock()
+    return lock
+
+def save_session(session_id, session):
+    """Store the session again, which also restarts its idle timer (blocking - run in a thread)"""
+    if not SESSION_STORE_PATH:
+        del session["messages"][:-SESSION_MAX_MESSAGES]
+        _sessions[session_id] = session
+        return
+
+    new_messages = session["messages"][session["stored_messages"]:]
+    with _lock:
+        conn = _connection()
+        while True:
+            now = time.time()
+            with conn:
+                cur = conn.execute(
+                    "UPDATE sessions SET data = ?, version = version + 1, updated_at = ? WHERE id = ? AND version = ?",
+                    (_dump(session), now, session_id, session["version"])
+                )
+            if cur.rowcount:
+                return
+
+            # Another worker saved a turn of this session in the meantime: keep its
+            # history and append this turn's messages after it
+            row = conn.execute("SELECT data, version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return
+            latest = _load(row)
+            session["messages"] = latest["messages"] + new_messages
+            session["version"] = latest["version"]
+
+def move_session(session, latitude, longitude):
+    """Update the session location, forgetting the resolved address if the user moved materially"""
+    if latitude is None or longitude is None:
+        return
+    if haversine(session["latitude"], session["longitude"], latitude, longitude) > SESSION_MOVE_KM:
+        session["location_info"] = None
+    session["latitude"] = latitude
+    session["longitude"] = longitude
+
+def session_categories(session):
+    """Categories the session's current places cover, main need first"""
+    if session["service_type"] is None:
+        return []
+    return [session["service_type"]] + list(session["related"])
+
+def needs_new_places(session, categories):
+    """Places are re-fetched only when the categories change or the user moved materially"""
+    if session["places"] is None or session_categories(session) != categories:
+        return True
+    places_lat, places_lon = session["places_at"]
+    return haversine(places_lat, places_lon, session["latitude"], session["longitude"]) > SESSION_MOVE_KM
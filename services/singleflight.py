@@ -0,0 +1,20 @@
+import asyncio
+
+# Upstream computations currently running, keyed by what they compute
+_inflight = {}
+
+async def coalesce(key, make_coro):
+    """Run make_coro() once per key at a time; concurrent callers share its result"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(make_coro())
+        _inflight[key] = task
+
+        def forget(done):
+            if _inflight.get(key) is done:
+                del _inflight[key]
+
+        task.add_done_callback(forget)
+
+    # A waiter that gets cancelled (e.g. client disconnect) must not cancel the shared work
+    return await asyncio.shield(task)
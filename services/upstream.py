@@ -0,0 +1,103 @@
+import os
+import importlib.util
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 keep-alive without it
+HTTP2_ENABLED = (
+    os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+    and importlib.util.find_spec("h2") is not None
+)
+
+# Per-upstream pool limits and timeouts
+UPSTREAMS = {
+    "places": {
+        "timeout": float(os.getenv("PLACES_TIMEOUT", "8.0")),
+        "max_connections": int(os.getenv("PLACES_MAX_CONNECTIONS", "50")),
+        "max_keepalive_connections": int(os.getenv("PLACES_MAX_KEEPALIVE", "20")),
+    },
+    "geocode": {
+        "timeout": float(os.getenv("GEOCODE_TIMEOUT", "5.0")),
+        "max_connections": int(os.getenv("GEOCODE_MAX_CONNECTIONS", "20")),
+        "max_keepalive_connections": int(os.getenv("GEOCODE_MAX_KEEPALIVE", "10")),
+    },
+}
+
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "60.0"))
+
+# Override to point Places and Geocoding calls at a stand-in server (see bench/)
+MAPS_BASE_URL = os.getenv("MAPS_BASE_URL", "https://maps.googleapis.com").rstrip("/")
+
+_clients = {}
+_counters = {name: {"requests": 0, "connections_opened": 0} for name in UPSTREAMS}
+
+def _create_client(name):
+    config = UPSTREAMS[name]
+    counters = _counters[name]
+
+    async def trace(event_name, info):
+        # Every new TCP connection is a handshake we could not avoid by reuse
+        if event_name == "connection.connect_tcp.complete":
+            counters["connections_opened"] += 1
+
+    async def on_request(request):
+        counters["requests"] += 1
+        request.extensions["trace"] = trace
+
+    limits = httpx.Limits(
+        max_connections=config["max_connections"],
+        max_keepalive_connections=config["max_keepalive_connections"],
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+    return httpx.AsyncClient(
+        timeout=config["timeout"],
+        limits=limits,
+        http2=HTTP2_ENABLED,
+        event_hooks={"request": [on_request]}
+    )
+
+async def start_clients():
+    """Open one pooled client per upstream (called from the app lifespan)"""
+    for name in UPSTREAMS:
+        if name not in _clients:
+            _clients[name] = _create_client(name)
+
+async def close_clients():
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+def get_client(name):
+    """Return the shared client for an upstream, creating it on first use outside the app"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _create_client(name)
+    return client
+
+def pool_stats():
+    """Connection pool statistics per upstream"""
+    stats = {}
+    for name in UPSTREAMS:
+        counters = _counters[name]
+        entry = {
+            "http2": HTTP2_ENABLED,
+            "requests": counters["requests"],
+            "connections_opened": counters["connections_opened"],
+            "requests_reusing_connection": max(counters["requests"] - counters["connections_opened"], 0),
+            "connections_open": 0,
+            "connections_idle": 0,
+            "requests_waiting": 0,
+        }
+
+        client = _clients.get(name)
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        if pool is not None:
+            connections = list(pool.connections)
+            entry["connections_open"] = len(connections)
+            entry["connections_idle"] = sum(1 for c in connections if c.is_idle())
+            entry["requests_waiting"] = sum(1 for r in getattr(pool, "_requests", []) if r.is_queued())
+
+        stats[name] = entry
+    return stats